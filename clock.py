@@ -0,0 +1,118 @@
+# Clock used by every timing loop of the project
+#
+# All modules read the time with clock.now() and wait with clock.sleep() instead of
+# calling the time module directly. By default this is the system's monotonic clock;
+# installing a VirtualClock with set_clock() lets simulations and benchmarks run a
+# whole trip (or hours of milestones) in a fraction of the real time.
+
+import threading
+import time as _time
+
+class SystemClock:
+    """Real time, based on the monotonic clock"""
+    def now(self):
+        return _time.monotonic()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        """Sleep until event is set or timeout seconds passed, return whether it was set"""
+        return event.wait(timeout)
+
+    def notify(self):
+        pass
+
+class VirtualClock:
+    """Clock that only moves forward when advance() is called
+
+    Threads calling sleep() block until the virtual time reaches their deadline.
+    advance() moves the time from deadline to deadline and, each time, waits for the
+    woken threads to go back to sleep before going further, so the loops of every
+    component run in the same order as they would in real time.
+    """
+    def __init__(self, start=0.0, settle_timeout=1.0):
+        self._now = start
+        self.settle_timeout = settle_timeout  # Real seconds to wait for a busy thread before moving on
+        self._condition = threading.Condition()
+        self._deadlines = {}  # Sleeping thread -> wake-up time
+        self._events = {}  # Thread waiting in wait() -> the event that can wake it early
+        self._threads = set()  # Every thread that ever slept on this clock
+
+    def now(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self.wait(None, seconds)
+
+    def wait(self, event, timeout=None):
+        """Sleep until event is set (followed by notify()) or timeout virtual seconds passed"""
+        thread = threading.current_thread()
+        with self._condition:
+            self._threads.add(thread)
+            deadline = self._now + max(0.0, timeout) if timeout is not None else float("inf")
+            self._deadlines[thread] = deadline
+            self._events[thread] = event
+            self._condition.notify_all()
+            while self._now < deadline and not (event and event.is_set()):
+                self._condition.wait()
+            del self._deadlines[thread]
+            del self._events[thread]
+            self._condition.notify_all()
+        return bool(event and event.is_set())
+
+    def notify(self):
+        """Wake the threads in wait() whose event was just set"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def advance(self, seconds):
+        """Move the virtual time forward, running every loop that is due on the way"""
+        with self._condition:
+            target = self._now + seconds
+            while True:
+                self._wait_settled()
+                due = [deadline for deadline in self._deadlines.values() if deadline <= target]
+                if not due:
+                    break
+                self._now = max(self._now, min(due))
+                self._condition.notify_all()
+            self._now = target
+            self._condition.notify_all()
+            self._wait_settled()
+
+    def _wait_settled(self):
+        """Wait until every live thread using the clock sleeps past the current time"""
+        end = _time.monotonic() + self.settle_timeout
+        while True:
+            self._threads = {thread for thread in self._threads if thread.is_alive()}
+            busy = [thread for thread in self._threads
+                    if self._deadlines.get(thread, self._now) <= self._now
+                    or (self._events.get(thread) and self._events[thread].is_set())]
+            remaining = end - _time.monotonic()
+            if not busy or remaining <= 0:
+                return
+            self._condition.wait(remaining)
+
+_clock = SystemClock()
+
+def set_clock(clock):
+    """Install the clock used by all modules (call before creating the components)"""
+    global _clock
+    _clock = clock
+
+def get_clock():
+    return _clock
+
+def now():
+    return _clock.now()
+
+def sleep(seconds):
+    _clock.sleep(seconds)
+
+def wait(event, timeout=None):
+    """Wait for a threading.Event; whoever sets it must then call clock.notify()"""
+    return _clock.wait(event, timeout)
+
+def notify():
+    _clock.notify()
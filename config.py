@@ -1,5 +1,8 @@
 ### WHEEL_METER.PY
 
+# GPIO backend
+GPIO_BACKEND = "rpi" # "rpi" for the Raspberry Pi pins, "sim" to replay a ride without hardware (or set LEGIBLE_GPIO=sim)
+
 # Wheel Sensors
 PIN = 17          # GPIO27 (pin 11) - Main wheel sensor
 PEDAL_PIN1 = 27   # GPIO27 (pin 13) - First pedal sensor
@@ -10,6 +13,10 @@ ENCODER_CLK = 23  # GPIO23 (pin 16) - Encoder clock
 ENCODER_DT = 24   # GPIO24 (pin 18) - Encoder data
 ENCODER_SW = 25   # GPIO25 (pin 22) - Encoder switch
 VOLUME_SAVE_PIN = 16  # GPIO16 (pin 36) - Save button
+ENCODER_TRANSITIONS_PER_DETENT = 4 # Quadrature transitions in one click of the encoder
+ENCODER_STEP = 2 # Volume change (in %) per click when turning slowly
+ENCODER_ACCELERATION = [(0.03, 8), (0.08, 4)] # (max seconds between clicks, volume change in %) when turning faster, fastest first
+ENCODER_DEBOUNCE = 0.3 # Time in seconds during which further presses of the encoder switch are ignored
 
 # RGB LED Pins (Common cathode LED)
 LED_R = 5         # GPIO5  (pin 29) - Red channel
@@ -17,22 +24,66 @@ LED_G = 6         # GPIO6  (pin 31) - Green channel
 LED_B = 13        # GPIO13 (pin 33) - Blue channel
 LED_BLINK_DURATION = 0.2  # Seconds for each blink
 LED_BLINK_COUNT = 3  # Number of blinks for audio changes
+LED_PWM_FREQUENCY = 200  # PWM frequency (Hz) of the LED channels (software PWM, or hardware-timed with the pigpio pin factory)
+LED_FRAME_RATE = 50  # Frames per second rendered while an LED animation runs
+LED_BASE_BRIGHTNESS = 0.2  # Green brightness before the first milestone
+LED_MILESTONE_STEP = 0.1  # Green brightness added by each milestone
 
 PEDAL_SENSOR_DISTANCE = 0.05 # Distance between pedal sensors in meters
-MOVEMENT_TIMEOUT = 2 # Time in seconds after which wheel is considered stopped
+PEDAL_RADIUS = 0.17 # Radius (in meters) at which the pedal magnet turns
+MOVEMENT_TIMEOUT = 2 # Time in seconds without pedal edge after which the pedal is considered stopped, until a whole pedal revolution was timed
 MIN_SPEED = 0.5 # Minimum speed in km/h to consider wheel moving
 
 BOUNCE_TIME = 0.005 # The time span during which the sensor ingores inputs after a trigger (necessary)
 DEFAULT_DIAMETER = 622 # The default diameter of the wheel (in millimeters)
+WHEEL_MAGNETS = 1 # Number of magnets on the wheel (sensor pulses per revolution)
+MAGNET_CALIBRATION = True # Learn the actual spacing of the magnets from the edge intervals (when WHEEL_MAGNETS > 1)
+MAGNET_CALIBRATION_RATE = 0.05 # How fast the learnt spacing follows each new interval (0-1)
+MAGNET_MAX_UNEVENNESS = 0.3 # Largest spacing error learnt, as a fraction of the even spacing (bigger ones are speed changes)
 PERIOD = 3.5 # The duration between each measuring (in seconds)
 USE_AVG_SPEED = False # Whether to use the average speed instead of the direct speed
 AVG_SMOOTHNESS = 5 # The amount of stored previous speed (used to compute a rolling average)
+SPEED_FILTER = "average" # Filter giving the average speed: "average" (of AVG_SMOOTHNESS speeds), "ewma", "median" (of AVG_SMOOTHNESS speeds) or "alpha_beta" (also estimates the acceleration)
+FILTER_EWMA_ALPHA = 0.3 # Smoothing factor of the "ewma" filter (0-1, higher reacts faster)
+ALPHA_BETA_ALPHA = 0.5 # Share of the error corrected on the speed by the "alpha_beta" filter (0-1)
+ALPHA_BETA_BETA = 0.1 # Share of the error corrected on the acceleration by the "alpha_beta" filter (0-1)
+
+# Speed estimation
+SPEED_ESTIMATOR = "median" # "window" (count edges every PERIOD), "last" (last interval), "median" (median of MEDIAN_INTERVALS intervals) or "ewma"
+EDGE_BUFFER_SIZE = 16 # The amount of stored sensor edge timestamps (ring buffer)
+MEDIAN_INTERVALS = 3 # The amount of intervals used by the "median" estimator
+EWMA_ALPHA = 0.4 # Smoothing factor of the "ewma" estimator (0-1, higher reacts faster)
+EDGE_TIMEOUT = 3.5 # Time in seconds without a wheel edge after which speed drops to 0
+DECAY_RATE = 0.1 # How often (in seconds) the speed is lowered while waiting for a late edge
+CADENCE_ESTIMATOR = "last" # Estimator of the pedal cadence, from the time of each revolution ("last", "median" or "ewma")
+STOP_OVERDUE_FACTOR = 2.0 # A wheel or pedal is stopped once its next edge is this many times later than its last interval
+STOP_COAST_FACTOR = 1.3 # The same for the wheel while the pedals don't move (a rider who stopped pedalling and slows down is stopping)
+
+# Speed prediction
+USE_SPEED_PREDICTION = False # Drive the sound changes from the speed forecast PREDICTION_HORIZON seconds ahead
+PREDICTION_HORIZON = 1.0 # How far ahead (in seconds) the speed is forecast, about the time the fades take
+SPEED_HYSTERESIS = 0.5 # With the prediction, how far (in km/h) past a speed threshold the forecast must go to change range
+
+# Persistent state
+STATE_FILE = "legible_state.json" # File keeping the runtime settings and state across restarts (master volume, milestones, trip)
+STATE_SAVE_DELAY = 2.0 # Seconds after a change before the state is written (the changes in between share one write)
+RESUME_SNAPSHOT_INTERVAL = 30.0 # Seconds between snapshots of the trip and milestone state while riding (frame changes and stops are saved right away)
+RESUME_MAX_AGE = 60 # A trip or milestone state saved less than this many seconds before a restart is resumed, an older one starts over
+
+# Simulation (only used with the "sim" GPIO backend)
+SIM_TRACE = None # Path of a recorded edge trace (CSV: time,pin,value) to replay
+SIM_PROFILE = None # Path of a speed profile (CSV: time,speed_kmh,cadence_rpm) to turn into edges
 
 # Milestone settings
 MILESTONE_TIME = 1 * 60  # Time in seconds (5 minutes) to count as one milestone
 MILESTONE_NOTIFICATION = 3  # Number of milestones needed to trigger a mark
 MILESTONE_DEBUG = True  # Show milestone progress in debug mode
 
+# Scheduler (one thread runs the periodic tasks of all components, see scheduler.py)
+SCHEDULER_TICK = 0.01 # Resolution (in seconds) of the scheduler's timer wheel
+SCHEDULER_SLOTS = 256 # Number of slots of the timer wheel
+MOVEMENT_CHECK_RATE = 0.1 # How often (in seconds) the pedal is checked for a stop and shared values are refreshed
+
 # Debug settings
 DEBUG_MODE = True  # Master debug switch
 DEBUG_REFRESH_RATE = 0.5  # How often to update debug information (seconds)
@@ -44,6 +95,14 @@ DEBUG_VOLUME = True
 DEBUG_LED = False
 DEBUG_SOUND = True  # Add this line to monitor sound status
 
+# Event log (debug output of the main loop and the sound manager, see event_log.py)
+LOG_BUFFER_SIZE = 4096 # Events kept in memory between two writes (the oldest are dropped when full)
+LOG_FLUSH_INTERVAL = 0.5 # How often (in seconds) the buffered events are written out
+LOG_FORMAT = "text" # "text" or "json" (one event per line)
+LOG_FILE = None # File the events are appended to (None for the terminal)
+LOG_RATE_LIMITS = {"trip.status": 0.5, "trip.playing": 0.5, "sound.status": 0.5} # Minimum seconds between two events of a kind ("component.event")
+LOG_SAMPLING = {} # Only log one event out of N for a kind, e.g. {"trip.playing": 10}
+
 ### LEGIBLE.PY
 
 # VOLUME_CURVES contains the volume configuration for each track. For each pair of values, the first one represents the speed (percentage), while the second one represents the volume (from 0 to 1).
@@ -59,9 +118,24 @@ VOLUME_CURVES = {
 
 FADE_MS = 1000 # The fade-in effect (in milliseconds) when a track (re)starts
 MAX_SPEED = 50 # The maximum speed (in km/h) used to make interpolations between tracks
-LERP_SPEED = 0.05  # Speed of volume changes (0.0-1.0)
+CURVE_TABLE_RESOLUTION = 0.1 # Step (in % of MAX_SPEED) of the precompiled volume curves table
+LERP_SPEED = 0.05  # Speed of volume changes (0.0-1.0), applied once per FADE_INTERVAL
+FADE_INTERVAL = 0.1 # Time in seconds between two fade steps (the main loop only wakes up this often while volumes are changing)
+FADE_EPSILON = 0.001 # Volume difference (0.0-1.0) under which a fade is considered finished
+GAIN_EPSILON = 0.004 # Smallest change (0.0-1.0) of a channel's output volume sent to the mixer while fading (pygame channels have 128 volume steps)
+MIXER_BACKEND = "pygame" # "pygame" (channel volumes set by the control loop) or "numpy" (NumPy mixing with per-sample gain ramps, needs sounddevice)
+MIXER_BLOCKSIZE = 512 # Samples mixed per audio callback with the "numpy" backend
+MIXER_RAMP_SECONDS = 2.0 # Time for a full 0 to 1 gain ramp with the "numpy" backend
+USE_PCM_CACHE = True # Load tracks from decoded PCM files (see pcm_cache.py) instead of decoding the MP3s on every start
+PCM_CACHE_DIR = ".pcm_cache" # Folder (relative to the project) holding the decoded tracks
+USE_STREAMING = True # Stream large tracks in chunks from the PCM cache instead of keeping them decoded in memory
+STREAM_THRESHOLD_MB = 4 # MP3 size (in MB) from which a track is streamed
+STREAM_CHUNK_SECONDS = 2.0 # Length of each streamed chunk (two chunks per track are kept in memory)
+TRACK_MANIFEST = "manifest.json" # Optional file of Audios/ listing the tracks (JSON object of name -> file name), otherwise every audio file of Audios/ is a track named after the file
+TRACK_MEMORY_BUDGET_MB = 128 # Memory (in MB) the loaded tracks may take, beyond it the least recently used tracks the trip doesn't need are unloaded
 MONITOR_VOLUMES = False # Not recommended, because it takes ressources that are needed for continuous audio. Only use for testing purposes.
 
 # Volume settings
 DEFAULT_MASTER_VOLUME = 0.5  # Default master volume level (0.0-1.0)
 MASTER_VOLUME = 1.0  # Current master volume level (0.0-1.0)
+ENCODER_MASTER_VOLUME = False  # Scale the trip volumes by the encoder position; off, they play at full level as they always did
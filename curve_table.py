@@ -0,0 +1,46 @@
+# VOLUME_CURVES compiled into a lookup table, so all the track volumes for a speed
+# come from a single vectorized lookup instead of one np.interp per track and tick
+
+import numpy as np
+from config import *
+
+class CurveTable:
+    """Dense speed -> volume table, one row per track"""
+    def __init__(self, curves=VOLUME_CURVES, max_speed=MAX_SPEED, resolution=CURVE_TABLE_RESOLUTION):
+        self.max_speed = max_speed
+        self.resolution = resolution  # Table step, in % of max_speed
+        self.compile(curves)
+
+    def compile(self, curves):
+        """(Re)build the table from curves, replacing the previous one at once
+
+        Safe to call while another thread reads volumes: readers see either the old
+        or the new table, never a mix.
+        """
+        names = list(curves)
+        speeds = np.arange(0, 100 + self.resolution, self.resolution)
+        table = np.empty((len(names), len(speeds)))
+        for row, name in enumerate(names):
+            curve_speeds, curve_volumes = zip(*curves[name])
+            table[row] = np.interp(speeds, curve_speeds, curve_volumes)
+        self._compiled = (names, {name: row for row, name in enumerate(names)}, table)
+
+    @property
+    def names(self):
+        return self._compiled[0]
+
+    def volumes(self, speed):
+        """Volumes (0-1) of every track at speed (km/h), in the order of names"""
+        return self._lookup(self._compiled[2], speed)
+
+    def volume(self, name, speed):
+        """Volume (0-1) of a single track at speed (km/h)"""
+        names, rows, table = self._compiled
+        return self._lookup(table, speed)[rows[name]]
+
+    def _lookup(self, table, speed):
+        # Linear interpolation between the two closest columns
+        position = min(max(speed * 100 / self.max_speed / self.resolution, 0), table.shape[1] - 1)
+        index = min(int(position), table.shape[1] - 2)
+        fraction = position - index
+        return table[:, index] * (1 - fraction) + table[:, index + 1] * fraction
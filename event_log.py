@@ -0,0 +1,131 @@
+# Structured event log for the debug output of the control path
+#
+# log.debug()/log.info() only append a tuple to an in-memory ring buffer; a background
+# thread formats and writes the events every LOG_FLUSH_INTERVAL seconds. Each
+# component has its own level, following the DEBUG_* flags of config.py, and hot
+# events can be rate-limited (LOG_RATE_LIMITS) or sampled (LOG_SAMPLING).
+
+import atexit
+import json
+import sys
+from collections import deque
+from threading import Thread, Lock
+import clock
+from config import *
+
+DEBUG = 10
+INFO = 20
+OFF = 100
+
+def _component_levels():
+    """Level of each component, from the DEBUG_* flags"""
+    flags = {
+        "trip": True,
+        "sound": DEBUG_SOUND,
+        "main_wheel": DEBUG_MAIN_WHEEL,
+        "pedal_wheel": DEBUG_PEDAL_WHEEL,
+        "volume": DEBUG_VOLUME,
+        "led": DEBUG_LED,
+        "milestone": MILESTONE_DEBUG,
+    }
+    return {component: DEBUG if DEBUG_MODE and flag else INFO for component, flag in flags.items()}
+
+class EventLog:
+    def __init__(self, capacity=LOG_BUFFER_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        self.levels = _component_levels()
+        self.events = deque(maxlen=capacity)  # Appends are atomic, the oldest events drop when full
+        self.flush_interval = flush_interval
+        self.rate_limits = dict(LOG_RATE_LIMITS)
+        self.sampling = dict(LOG_SAMPLING)
+        self.last_logged = {}
+        self.counters = {}
+        self.dropped = 0  # Events lost because the buffer was full
+        self.output = None
+        self.flush_lock = Lock()
+        self.thread = None
+
+    def enabled(self, component, level=DEBUG):
+        return level >= self.levels.get(component, INFO)
+
+    def due(self, component, event, name=None, level=DEBUG):
+        """Whether an event would be logged now (enabled and not rate-limited), to skip building its fields"""
+        if not self.enabled(component, level):
+            return False
+        kind = f"{component}.{event}"
+        if kind not in self.rate_limits:
+            return True
+        last = self.last_logged.get((component, event, name))
+        return last is None or clock.now() - last >= self.rate_limits[kind]
+
+    def set_level(self, component, level):
+        self.levels[component] = level
+
+    def debug(self, component, event, **fields):
+        if self.enabled(component, DEBUG):
+            self._append(DEBUG, component, event, fields)
+
+    def info(self, component, event, **fields):
+        if self.enabled(component, INFO):
+            self._append(INFO, component, event, fields)
+
+    def _append(self, level, component, event, fields):
+        # Events of the same kind (and the same "name" field) are rate-limited and sampled together
+        key = (component, event, fields.get("name"))
+        kind = f"{component}.{event}"
+        if kind in self.sampling:
+            count = self.counters.get(key, 0)
+            self.counters[key] = count + 1
+            if count % self.sampling[kind]:
+                return
+        current_time = clock.now()
+        if kind in self.rate_limits:
+            last = self.last_logged.get(key)
+            if last is not None and current_time - last < self.rate_limits[kind]:
+                return
+            self.last_logged[key] = current_time
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((current_time, level, component, event, fields))
+        if self.thread is None:
+            self.start()
+
+    def start(self):
+        with self.flush_lock:
+            if self.thread is not None:
+                return
+            self._start()
+
+    def _start(self):
+        self.output = open(LOG_FILE, "a") if LOG_FILE else None  # None: sys.stdout at the time of writing
+        self.thread = Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            clock.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write out every buffered event"""
+        with self.flush_lock:
+            lines = []
+            while self.events:
+                lines.append(self._format(*self.events.popleft()))
+            if self.dropped:
+                lines.append(self._format(clock.now(), INFO, "log", "dropped", {"count": self.dropped}))
+                self.dropped = 0
+            if lines:
+                output = self.output or sys.stdout
+                output.write("\n".join(lines) + "\n")
+                output.flush()
+
+    def _format(self, timestamp, level, component, event, fields):
+        if LOG_FORMAT == "json":
+            return json.dumps({"time": round(timestamp, 4), "level": "debug" if level == DEBUG else "info",
+                               "component": component, "event": event, **fields}, default=str)
+        values = " ".join(f"{name}={value:.2f}" if isinstance(value, float) else f"{name}={value}"
+                          for name, value in fields.items())
+        return f"{timestamp:10.2f} {component:<11} {event} {values}".rstrip()
+
+log = EventLog()
@@ -0,0 +1,18 @@
+# Selects the GPIO backend: the real Raspberry Pi pins or the simulation in sim_gpio.py
+
+import os
+from config import *
+
+# The LEGIBLE_GPIO environment variable overrides GPIO_BACKEND ("rpi" or "sim")
+BACKEND = os.environ.get("LEGIBLE_GPIO", GPIO_BACKEND)
+
+if BACKEND == "sim":
+    from sim_gpio import Button, DigitalOutputDevice, PWMLED, GPIO
+elif BACKEND == "rpi":
+    from gpiozero import Button, DigitalOutputDevice, PWMLED
+    from RPi import GPIO
+else:
+    raise ValueError(f"Unknown GPIO backend '{BACKEND}', expected 'rpi' or 'sim'")
+
+def is_simulated():
+    return BACKEND == "sim"
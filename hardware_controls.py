@@ -1,17 +1,55 @@
-from gpiozero import Button, DigitalOutputDevice
-from time import sleep
-import threading
+from gpio_backend import PWMLED, GPIO
+from clock import now
+from scheduler import scheduler
+from state_store import state
+from event_log import log
 from config import *
 import json
-import os
 import atexit
-from threading import Thread
-from RPi import GPIO
+from threading import Lock
 
 # Set GPIO mode at module level
 GPIO.setmode(GPIO.BCM)
 
+# Quadrature transitions, indexed by (previous state << 2) | new state, where a state
+# is (CLK << 1) | DT. Clockwise turns go 00 -> 10 -> 11 -> 01 -> 00. Impossible
+# transitions (both pins changed, a missed edge) count as 0.
+QUADRATURE_TABLE = [0, -1, 1, 0, 1, 0, 0, -1, -1, 0, 0, 1, 0, 1, -1, 0]
+
+# LED effect priorities: higher ones are drawn over lower ones
+MILESTONE_PRIORITY = 0
+AUDIO_CHANGE_PRIORITY = 10
+SAVE_PRIORITY = 20
+
+class Level:
+    """Steady levels (0-1, None leaves the channel to the effects below)"""
+    def __init__(self, red=None, green=None, blue=None, duration=None):
+        self.levels = (red, green, blue)
+        self.duration = duration  # Seconds, None lasts until replaced
+    
+    def color(self, elapsed):
+        return self.levels
+
+class Blink:
+    """Blinks color count times, every other channel off"""
+    def __init__(self, color, count=LED_BLINK_COUNT, step=LED_BLINK_DURATION):
+        self.on = color
+        self.step = step
+        self.duration = 2 * count * step
+    
+    def color(self, elapsed):
+        return self.on if int(elapsed / self.step) % 2 == 0 else (0.0, 0.0, 0.0)
+
 class RGBLed:
+    """RGB LED drawn from a stack of prioritized effects
+    
+    Every frame, the effects are drawn from the lowest priority to the highest and
+    the channels an effect sets hide the ones below. A finished effect just drops
+    out of the stack, revealing what is below it, so no effect has to save and
+    restore the LED state. Frames are rendered on the shared scheduler, at
+    LED_FRAME_RATE while an effect with a duration is running and once per change
+    otherwise.
+    """
     _instance = None
     
     def __new__(cls):
@@ -25,16 +63,21 @@ class RGBLed:
             return
             
         try:
-            # Using DigitalOutputDevice instead of PWMLED for simple on/off control
-            self.red = DigitalOutputDevice(LED_R)
-            self.green = DigitalOutputDevice(LED_G)
-            self.blue = DigitalOutputDevice(LED_B)
+            # PWM channels, so the brightness can change
+            self.red = PWMLED(LED_R, frequency=LED_PWM_FREQUENCY)
+            self.green = PWMLED(LED_G, frequency=LED_PWM_FREQUENCY)
+            self.blue = PWMLED(LED_B, frequency=LED_PWM_FREQUENCY)
+            
+            self.effects = {}  # Name -> (priority, start time, effect), replaced as a whole on change
+            self.lock = Lock()
+            self.render_task = None
             
-            # Set initial state - only green LED on to save power
-            self.red.off()
-            self.green.on()
-            self.blue.off()
-            self._blink_thread = None
+            # Only dim green to save power
+            self.show_milestones(0)
+            
+            # Debug output runs on the shared scheduler
+            if log.enabled("led"):
+                self.debug_task = scheduler.every(DEBUG_REFRESH_RATE, self.debug_output)
             
             # Register cleanup function
             atexit.register(self.cleanup)
@@ -48,6 +91,8 @@ class RGBLed:
     
     def cleanup(self):
         """Clean up GPIO resources"""
+        if getattr(self, 'render_task', None):
+            self.render_task.cancel()
         if hasattr(self, 'red'):
             self.red.close()
         if hasattr(self, 'green'):
@@ -55,42 +100,54 @@ class RGBLed:
         if hasattr(self, 'blue'):
             self.blue.close()
     
+    def play(self, name, effect, priority):
+        """Start effect, replacing the effect called name (callable from any thread)"""
+        with self.lock:
+            effects = dict(self.effects)
+            effects[name] = (priority, now(), effect)
+            self.effects = effects
+            if effect.duration is not None and self.render_task is None:
+                self.render_task = scheduler.every(1 / LED_FRAME_RATE, self.render, name="led_render")
+        scheduler.after(0, self.render, name="led_render")
+    
+    def show_milestones(self, milestone_count):
+        """Green brightness increases with milestones"""
+        brightness = min(1.0, LED_BASE_BRIGHTNESS + milestone_count * LED_MILESTONE_STEP)
+        self.play("milestones", Level(0.0, brightness, 0.0), MILESTONE_PRIORITY)
+    
     def blink_audio_change(self):
         """Blink blue LED for audio changes"""
-        if self._blink_thread and self._blink_thread.is_alive():
-            return
-        
-        def blink():
-            # Store current states
-            current_r = self.red.value
-            current_g = self.green.value
-            current_b = self.blue.value
-            
-            for _ in range(LED_BLINK_COUNT):
-                # Turn off red and green, only blue blinks
-                self.red.off()
-                self.green.off()
-                self.blue.on()
-                sleep(LED_BLINK_DURATION)
-                self.blue.off()
-                sleep(LED_BLINK_DURATION)
-            
-            # Restore original states
-            self.red.value = current_r
-            self.green.value = current_g
-            self.blue.value = current_b
+        self.play("audio_change", Blink((0.0, 0.0, 1.0)), AUDIO_CHANGE_PRIORITY)
+    
+    def confirm_save(self):
+        """Light green fully for a moment"""
+        self.play("save", Level(green=1.0, duration=0.2), SAVE_PRIORITY)
+    
+    def render(self):
+        """Draw one frame"""
+        current_time = now()
+        with self.lock:
+            effects = self.effects
+            running = {name: item for name, item in effects.items()
+                       if item[2].duration is None or current_time - item[1] < item[2].duration}
+            if len(running) != len(effects):
+                self.effects = effects = running
+            if self.render_task and all(effect.duration is None for _, _, effect in effects.values()):
+                self.render_task.cancel()
+                self.render_task = None
         
-        self._blink_thread = threading.Thread(target=blink, daemon=True)
-        self._blink_thread.start()
+        levels = [0.0, 0.0, 0.0]
+        for priority, start_time, effect in sorted(effects.values(), key=lambda item: item[0]):
+            for channel, level in enumerate(effect.color(current_time - start_time)):
+                if level is not None:
+                    levels[channel] = level
+        for device, level in zip((self.red, self.green, self.blue), levels):
+            if device.value != level:
+                device.value = level
 
     def debug_output(self):
-        while True:
-            if DEBUG_MODE and DEBUG_LED:
-                print("\n=== RGB LED Debug ===")
-                print(f"Red State: {self.red.value}")
-                print(f"Green State: {self.green.value}")
-                print(f"Blue State: {self.blue.value}")
-            sleep(DEBUG_REFRESH_RATE)
+        log.debug("led", "status", red=self.red.value, green=self.green.value, blue=self.blue.value,
+                  effects=",".join(self.effects))
 
 class VolumeEncoder:
     _instance = None
@@ -111,18 +168,23 @@ class VolumeEncoder:
             GPIO.setup(ENCODER_DT, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
             GPIO.setup(ENCODER_SW, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
             
+            self.listeners = []
+            self.led = None  # RGBLed confirming the saves
             self._position = int(self._load_volume() * 100)
-            self.clk_last_state = GPIO.input(ENCODER_CLK)
+            self.state = (GPIO.input(ENCODER_CLK) << 1) | GPIO.input(ENCODER_DT)
+            self.transitions = 0  # Quadrature transitions since the last detent
+            self.last_detent_time = 0
+            self.last_press_time = None
             self.running = True
             
-            # Start monitoring thread
-            self.monitor_thread = threading.Thread(target=self._monitor_rotation, daemon=True)
-            self.monitor_thread.start()
+            # Decode rotation and presses from edge interrupts instead of polling
+            GPIO.add_event_detect(ENCODER_CLK, GPIO.BOTH, callback=self._on_rotation)
+            GPIO.add_event_detect(ENCODER_DT, GPIO.BOTH, callback=self._on_rotation)
+            GPIO.add_event_detect(ENCODER_SW, GPIO.RISING, callback=self._on_press)
             
-            # Start debug thread if needed
-            if DEBUG_MODE:
-                self.debug_thread = threading.Thread(target=self.debug_output, daemon=True)
-                self.debug_thread.start()
+            # Debug output runs on the shared scheduler
+            if log.enabled("volume"):
+                self.debug_task = scheduler.every(DEBUG_REFRESH_RATE, self.debug_output)
             
             # Register cleanup
             atexit.register(self.cleanup)
@@ -134,28 +196,37 @@ class VolumeEncoder:
             self.cleanup()
             raise
     
-    def _monitor_rotation(self):
-        """Monitor encoder rotation in a separate thread"""
-        while self.running:
-            clk_state = GPIO.input(ENCODER_CLK)
-            dt_state = GPIO.input(ENCODER_DT)
-            
-            # Check rotation
-            if clk_state != self.clk_last_state:
-                if dt_state != clk_state:
-                    self.position = self.position + 1
-                else:
-                    self.position = self.position - 1
-                print(f"Position: {self.position}% | Volume: {self.volume:.2f}")
-            
-            self.clk_last_state = clk_state
+    def _on_rotation(self, channel):
+        """Edge callback of CLK and DT: follow the quadrature state machine"""
+        state = (GPIO.input(ENCODER_CLK) << 1) | GPIO.input(ENCODER_DT)
+        self.transitions += QUADRATURE_TABLE[(self.state << 2) | state]
+        self.state = state
+        
+        # One detent is a full cycle of 4 transitions
+        if abs(self.transitions) >= ENCODER_TRANSITIONS_PER_DETENT:
+            direction = 1 if self.transitions > 0 else -1
+            self.transitions = 0
             
-            # Check encoder button press with longer debounce
-            if GPIO.input(ENCODER_SW):
-                self._save_volume()
-                sleep(0.3)  # Longer debounce
+            # Accelerate: the faster the detents follow each other, the bigger the step
+            current_time = now()
+            interval = current_time - self.last_detent_time
+            self.last_detent_time = current_time
+            step = ENCODER_STEP
+            for max_interval, accelerated_step in ENCODER_ACCELERATION:
+                if interval <= max_interval:
+                    step = accelerated_step
+                    break
             
-            sleep(0.005)  # Slightly longer delay
+            self.position = self.position + direction * step
+            print(f"Position: {self.position}% | Volume: {self.volume:.2f}")
+    
+    def _on_press(self, channel):
+        """Edge callback of the encoder switch, debounced by timestamp"""
+        current_time = now()
+        if self.last_press_time is not None and current_time - self.last_press_time < ENCODER_DEBOUNCE:
+            return
+        self.last_press_time = current_time
+        self._save_volume()
     
     @property
     def position(self):
@@ -165,7 +236,15 @@ class VolumeEncoder:
     @position.setter
     def position(self, value):
         """Set position with bounds checking"""
-        self._position = max(0, min(100, value))
+        value = max(0, min(100, value))
+        if value != self._position:
+            self._position = value
+            for callback in self.listeners:
+                callback()
+    
+    def add_listener(self, callback):
+        """Call callback (from the GPIO callback thread) whenever the volume changes"""
+        self.listeners.append(callback)
     
     @property
     def volume(self):
@@ -179,42 +258,31 @@ class VolumeEncoder:
     def cleanup(self):
         """Clean up GPIO resources"""
         self.running = False
-        if hasattr(self, 'monitor_thread'):
-            self.monitor_thread.join(timeout=1.0)
+        for pin in (ENCODER_CLK, ENCODER_DT, ENCODER_SW):
+            try:
+                GPIO.remove_event_detect(pin)
+            except Exception:
+                pass  # Detection was never added
         GPIO.cleanup([ENCODER_CLK, ENCODER_DT, ENCODER_SW])
     
     def debug_output(self):
-        """Debug output thread"""
-        while self.running:
-            if DEBUG_MODE and DEBUG_VOLUME:
-                print("\n=== Volume Encoder Debug ===")
-                print(f"Position: {self.position}%")
-                print(f"Volume: {self.volume:.2f}")
-                print(f"CLK State: {GPIO.input(ENCODER_CLK)}")
-                print(f"DT State: {GPIO.input(ENCODER_DT)}")
-                print(f"Switch State: {GPIO.input(ENCODER_SW)}")
-            sleep(DEBUG_REFRESH_RATE)
+        """Debug output (scheduled every DEBUG_REFRESH_RATE, written by the event log)"""
+        if self.running:
+            log.debug("volume", "status", position=self.position, volume=self.volume,
+                      clk=GPIO.input(ENCODER_CLK), dt=GPIO.input(ENCODER_DT), switch=GPIO.input(ENCODER_SW))
     
     def _save_volume(self):
-        """Save volume to both JSON and config file"""
-        try:
-            # Save to JSON for persistence
-            with open('volume_setting.json', 'w') as f:
-                json.dump({
-                    'master_volume': self.volume,
-                    'position': self.position
-                }, f)
-            
-            # Update config.py
-            self._update_config_file()
-            
-            print(f"✓ Volume saved: {self.position}% ({self.volume:.2f})")
-                
-        except Exception as e:
-            print(f"Error saving volume: {e}")
+        """Save the volume in the state store (written to disk shortly after)"""
+        state.set("volume_position", self.position)
+        print(f"✓ Volume saved: {self.position}% ({self.volume:.2f})")
+        self._blink_confirmation()
     
     def _load_volume(self):
-        """Load volume from JSON file or use default"""
+        """Load volume from the state store, the old volume_setting.json file or use default"""
+        position = state.get("volume_position")
+        if position is not None:
+            self._position = position
+            return self.volume
         try:
             with open('volume_setting.json', 'r') as f:
                 data = json.load(f)
@@ -225,64 +293,7 @@ class VolumeEncoder:
         except:
             return DEFAULT_MASTER_VOLUME
     
-    def _update_config_file(self):
-        """Update the config.py file with new master volume"""
-        try:
-            # Get absolute path to config.py
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            config_path = os.path.join(current_dir, 'config.py')
-            
-            print(f"Attempting to update config file at: {config_path}")  # Debug line
-            
-            if not os.path.exists(config_path):
-                print(f"Error: Config file not found at {config_path}")
-                return
-            
-            # Read all lines from config file
-            with open(config_path, 'r') as f:
-                lines = f.readlines()
-            
-            # Find and update both DEFAULT_MASTER_VOLUME and MASTER_VOLUME
-            default_found = False
-            current_found = False
-            
-            for i, line in enumerate(lines):
-                if line.strip().startswith('DEFAULT_MASTER_VOLUME'):
-                    lines[i] = f"DEFAULT_MASTER_VOLUME = {self.volume:.2f}  # Default master volume level\n"
-                    default_found = True
-                    print(f"Updated DEFAULT_MASTER_VOLUME to {self.volume:.2f}")  # Debug line
-                elif line.strip().startswith('MASTER_VOLUME'):
-                    lines[i] = f"MASTER_VOLUME = {self.volume:.2f}  # Current master volume level\n"
-                    current_found = True
-                    print(f"Updated MASTER_VOLUME to {self.volume:.2f}")  # Debug line
-            
-            # Add values if not found
-            if not default_found:
-                lines.append(f"\nDEFAULT_MASTER_VOLUME = {self.volume:.2f}  # Default master volume level\n")
-                print("Added DEFAULT_MASTER_VOLUME line")  # Debug line
-            if not current_found:
-                lines.append(f"MASTER_VOLUME = {self.volume:.2f}  # Current master volume level\n")
-                print("Added MASTER_VOLUME line")  # Debug line
-            
-            # Write back to config file
-            with open(config_path, 'w') as f:
-                f.writelines(lines)
-            
-            print(f"Successfully updated config file with volume: {self.volume:.2f}")
-                
-        except Exception as e:
-            print(f"Error updating config file: {e}")
-            import traceback
-            traceback.print_exc()  # Print full error traceback
-    
     def _blink_confirmation(self):
         """Blink green LED briefly to confirm save"""
         if self.led:
-            def confirm_blink():
-                current_state = self.led.green.value
-                self.led.green.value = 1
-                sleep(0.2)
-                self.led.green.value = current_state
-            
-            thread = threading.Thread(target=confirm_blink, daemon=True)
-            thread.start() 
\ No newline at end of file
+            self.led.confirm_save()
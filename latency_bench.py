@@ -0,0 +1,246 @@
+# Edge-to-sound latency benchmark
+#
+# Rides a synthetic speed profile on the simulated pins, on a virtual clock, and
+# follows every wheel sensor edge through the stages that turn it into sound:
+#   estimator  the meter publishes a speed that includes the edge (MainWheel)
+#   trip       the main loop evaluates that speed (MainLoop.step)
+#   mixer      the next volume sent to the mixer (SoundManager.set_gains)
+# Latencies are in virtual time, so they show what the configuration costs (scheduler
+# tick, PERIOD, loop wake-ups, fades), not how loaded the machine was; the real time
+# each stage took to run is reported separately, along with the CPU time per
+# simulated minute. Each configuration runs in its own process.
+#
+# Usage:
+#   python latency_bench.py                            Run every configuration, save latency_results.json
+#   python latency_bench.py results.json               Save the results to results.json
+#   python latency_bench.py results.json before.json   Also show the changes since an earlier run
+
+import json
+import os
+from bisect import bisect_left
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DURATION = 60  # Simulated seconds ridden for each configuration
+BENCH_SPEEDS = (12, 28)  # The speed (km/h) swings between these two ...
+BENCH_SWING = 10  # ... every this many seconds
+BENCH_CADENCE = 70  # Pedal cadence (rpm) during the ride
+RESULTS_FILE = "latency_results.json"
+RESULT_MARKER = "RESULT "
+
+# config.py values changed by each configuration (the first one runs config.py as it is)
+CONFIGURATIONS = [
+    {},
+    {"SPEED_ESTIMATOR": "last"},
+    {"SPEED_ESTIMATOR": "ewma"},
+    {"SPEED_ESTIMATOR": "window", "PERIOD": 3.5},
+    {"SPEED_ESTIMATOR": "window", "PERIOD": 1.0},
+    {"LERP_SPEED": 0.2},
+    {"FADE_INTERVAL": 0.05},
+    {"FADE_INTERVAL": 0.2},
+]
+
+def configuration_name(overrides):
+    return " ".join(f"{key}={value}" for key, value in overrides.items()) or "default"
+
+def percentiles(values):
+    """p50, p95 and p99 (nearest rank) of values, in milliseconds"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))] * 1000, 3)
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "count": len(ordered)}
+
+def run_configuration(overrides):
+    """Ride the profile with the given config.py values, return the measurements"""
+    # Configure before anything imports config.py
+    os.environ["LEGIBLE_GPIO"] = "sim"
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import config
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    config.DEBUG_MODE = False
+    config.STATE_FILE = os.path.join(tempfile.mkdtemp(), "bench_state.json")
+
+    import clock
+    virtual_clock = clock.VirtualClock()
+    clock.set_clock(virtual_clock)
+
+    from threading import Thread
+    import ride_sim
+    from wheel_meter import main_wheel, volume_control
+    from sound_behavior import SoundManager
+    from trip_timeline import Trip, Frame, SpeedGain
+    from legible import Legible, MainLoop
+
+    sound_manager = SoundManager()
+    track = sound_manager.registry.names[0]
+    # One track whose volume follows the speed, so every new speed is a volume change
+    trip = Trip("benchmark", [Frame("Volume follows the speed", (track,), SpeedGain(per_kmh=3))])
+    legible = Legible(sound_manager, volume_control, trip=trip)
+    legible.start(None, clock.now())
+
+    edges = []  # Virtual time of each wheel edge
+    published = []  # (time, edges counted) of each speed the meter computed
+    evaluations = []  # (time, edges counted) seen by each trip evaluation
+    sends = []  # Time of each volume sent to the mixer
+    costs = {"estimator": [], "trip": [], "mixer": []}  # Real seconds each stage took
+
+    detected = main_wheel.detected
+    def traced_detected():
+        edges.append(clock.now())
+        detected()
+    main_wheel.sensor.when_pressed = traced_detected
+
+    def traced(stage, function):
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            costs[stage].append(time.perf_counter() - start)
+            return result
+        return call
+    main_wheel.take_edges = traced("estimator", main_wheel.take_edges)
+    sound_manager.set_gains = traced("mixer", sound_manager.set_gains)
+
+    # The "window" estimator only computes the speed in round_meter, every PERIOD
+    rounds = [False]
+    round_meter = traced("estimator", main_wheel.round_meter)
+    def traced_round_meter():
+        rounds[0] = True
+        round_meter()
+        rounds[0] = False
+    main_wheel.monitor_task.callback = traced_round_meter
+
+    publish = main_wheel._publish
+    def traced_publish(count, *args):
+        if main_wheel.estimator or rounds[0]:
+            published.append((clock.now(), count))
+        publish(count, *args)
+    main_wheel._publish = traced_publish
+
+    send = sound_manager._send
+    def traced_send(name, channel, output):
+        if name == track:
+            sends.append(clock.now())
+        send(name, channel, output)
+    sound_manager._send = traced_send
+
+    # The main loop of legible.py itself, on the virtual clock
+    main_loop = MainLoop(legible)
+    step = main_loop.step
+    def traced_step(current_time):
+        start = time.perf_counter()
+        deadline = step(current_time)
+        costs["trip"].append(time.perf_counter() - start)
+        evaluations.append((current_time, main_wheel.snapshot().count))
+        return deadline
+    main_loop.step = traced_step
+
+    low, high = BENCH_SPEEDS
+    profile = [(t, low if t // BENCH_SWING % 2 == 0 else high, BENCH_CADENCE)
+               for t in range(0, BENCH_DURATION + 1, BENCH_SWING)]
+    simulator = ride_sim.RideSimulator(ride_sim.profile_events(profile))
+
+    loop_thread = Thread(target=main_loop.run_on_clock, daemon=True)
+    loop_thread.start()
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    simulator.start()
+    for _ in range(BENCH_DURATION):
+        virtual_clock.advance(1)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    main_loop.stop()
+    simulator.stop()
+
+    # Follow each edge: the first published speed that counts it, the first trip
+    # evaluation at or after that and the first volume sent at or after the evaluation
+    latencies = {"estimator": [], "trip": [], "mixer": []}
+    publish_times = [t for t, _ in published]
+    evaluation_times = [t for t, _ in evaluations]
+    p = 0
+    for number, edge_time in enumerate(edges, 1):
+        while p < len(published) and (published[p][1] < number or published[p][0] < edge_time):
+            p += 1
+        if p == len(published):
+            break
+        estimator_time = publish_times[p]
+        e = bisect_left(evaluation_times, estimator_time)
+        if e == len(evaluations):
+            break
+        trip_time = evaluation_times[e]
+        s = bisect_left(sends, trip_time)
+        latencies["estimator"].append(estimator_time - edge_time)
+        latencies["trip"].append(trip_time - edge_time)
+        if s < len(sends):
+            latencies["mixer"].append(sends[s] - edge_time)
+
+    return {
+        "name": configuration_name(overrides),
+        "config": overrides,
+        "edges": len(edges),
+        "latency_ms": {stage: percentiles(values) for stage, values in latencies.items()},
+        "stage_cost_ms": {stage: percentiles(values) for stage, values in costs.items()},
+        "cpu_per_minute": cpu / BENCH_DURATION * 60,
+        "wall_seconds": wall,
+        "mixer_updates": {"sent": sound_manager.sent_updates, "skipped": sound_manager.skipped_updates},
+    }
+
+def run_all(configurations=CONFIGURATIONS):
+    """Run each configuration in a fresh process (the components are module singletons)"""
+    results = []
+    for overrides in configurations:
+        name = configuration_name(overrides)
+        print(f"Running {name}...", flush=True)
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", json.dumps(overrides)],
+                                 capture_output=True, text=True)
+        lines = [line for line in process.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+        if process.returncode or not lines:
+            print(f"- {name} failed:\n{process.stderr.strip()}")
+            continue
+        results.append(json.loads(lines[-1][len(RESULT_MARKER):]))
+    return results
+
+def _p95(result, stage):
+    stats = result["latency_ms"][stage]
+    return stats["p95"] if stats else None
+
+def print_results(results, previous=None):
+    before = {result["name"]: result for result in previous["results"]} if previous else {}
+    print(f"\n{'configuration':<36} {'stage':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'change p95':>11}")
+    for result in results:
+        for stage, stats in result["latency_ms"].items():
+            if not stats:
+                print(f"{result['name']:<36} {stage:<10} {'-':>8} {'-':>8} {'-':>8}")
+                continue
+            change = ""
+            if result["name"] in before and _p95(before[result["name"]], stage) is not None:
+                change = f"{stats['p95'] - _p95(before[result['name']], stage):+.1f}"
+            print(f"{result['name']:<36} {stage:<10} {stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f} {change:>11}")
+        cpu_change = ""
+        if result["name"] in before:
+            cpu_change = f" ({result['cpu_per_minute'] - before[result['name']]['cpu_per_minute']:+.2f})"
+        updates = result["mixer_updates"]
+        print(f"{'':<36} CPU {result['cpu_per_minute']:.2f} s per simulated minute{cpu_change}, "
+              f"{result['edges']} edges, {updates['sent']} volume updates sent, {updates['skipped']} skipped")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--run":
+        result = run_configuration(json.loads(sys.argv[2]))
+        print(RESULT_MARKER + json.dumps(result), flush=True)
+        os._exit(0)  # Don't wait for the daemon threads parked on the virtual clock
+    elif len(sys.argv) <= 3:
+        path = sys.argv[1] if len(sys.argv) > 1 else RESULTS_FILE
+        previous = None
+        if len(sys.argv) == 3:
+            with open(sys.argv[2]) as f:
+                previous = json.load(f)
+        results = run_all()
+        print_results(results, previous)
+        with open(path, "w") as f:
+            json.dump({"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "duration": BENCH_DURATION,
+                       "results": results}, f, indent=2)
+        print(f"\nSaved {path}")
+    else:
+        print("Usage: python latency_bench.py [results.json] [previous.json]")
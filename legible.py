@@ -6,267 +6,207 @@ print(Style.DIM, end="")
 import pygame
 print(Style.RESET_ALL)
 
-import time
-from wheel_meter import main_wheel, pedal
+import asyncio
+from threading import Event
+import clock
+from wheel_meter import main_wheel, pedal, led
 from sound_behavior import SoundManager
 from hardware_controls import VolumeEncoder
 from config import *
+from event_log import log
+from scheduler import scheduler
+from state_store import state
+from speed_predictor import SpeedPredictor
+from trip_timeline import Trip, Frame, SpeedGain, SpeedBands, TripTimeline
 import atexit
-from RPi import GPIO
+from gpio_backend import GPIO, is_simulated
+
+# Speed thresholds for long trip (km/h)
+SLOW_MAX = 9
+MEDIUM_MAX = 16
+# Anything above MEDIUM_MAX is considered fast
+
+# The trips: a new one only needs a Trip here (see trip_timeline.py)
+SHORT_TRIP = Trip("short", [
+    # 0-30s of riding: s1, s2, s3 introduced one by one, louder with speed
+    Frame("Introducing sounds gradually", ("s1", "s2", "s3"), SpeedGain(per_kmh=10, starts={"s2": 10, "s3": 20}),
+          ride_time=30),
+    # Until 2m30s: s4 with base volume + speed boost
+    Frame("Speed-boosted s4", ("s4",), SpeedGain(base=60, per_kmh=2), until=150, stop_timeout=60),
+    # Until 4m30s: s5 with variable volume
+    Frame("Variable s5", ("s5",), SpeedGain(base=60, per_kmh=2, low=40), until=270, stop_timeout=30),
+])
+
+LONG_TRIP = Trip("long", [
+    # One of bliss (s5), story (s6) and deconstruction (s7) per speed range, crossfading in 2s
+    Frame("Speed ranges", ("s5", "s6", "s7"),
+          SpeedBands((SLOW_MAX, MEDIUM_MAX), [{"s5": 1.0}, {"s6": 1.0}, {"s7": 1.0}],
+                     fade_rate=0.5, hysteresis=USE_SPEED_PREDICTION),
+          stop_timeout=15, mute_when_stopped=False),
+])
+
+class Legible:
+    """State of the piece, re-evaluated only when an input changes or a deadline is reached"""
+    def __init__(self, sound_manager, volume_control, trip=LONG_TRIP):
+        self.sound_manager = sound_manager
+        self.volume_control = volume_control
+        self.last_update = None
+        
+        # Optional speed forecast
+        self.predictor = SpeedPredictor() if USE_SPEED_PREDICTION else None
+        
+        # Initialize master volume
+        self.master_volume = 1.0
+        
+        # Blink the LED when the sounds change with the speed
+        self.timeline = TripTimeline(trip, sound_manager, on_sound_change=led.blink_audio_change)
+    
+    def reset(self):
+        self.timeline.reset()
+    
+    def snapshot(self, current_time):
+        """Trip state to resume from after a restart (None when no trip is running)"""
+        return self.timeline.snapshot(current_time)
+    
+    def resume(self, saved, current_time):
+        """Continue a trip from a snapshot, return whether it was recent enough to"""
+        return self.timeline.resume(saved, current_time)
+    
+    def start(self, saved, current_time):
+        """Resume the saved trip if it is recent enough, then load the tracks of the frame it is in
+
+        Only that frame's tracks are loaded before playing, the next frame's are prefetched.
+        """
+        if not self.resume(saved, current_time):
+            self.timeline.load_tracks()
+    
+    def update(self, current_time):
+        """Evaluate the trip once, with the inputs as they are at current_time"""
+        wheel = main_wheel.snapshot()
+        # The sounds follow the forecast speed when prediction is on
+        current_speed = self.predictor.update(wheel, current_time) if self.predictor else wheel.speed
+        is_moving = wheel.moving
+        # Time since the previous evaluation (one fade step for the first one)
+        dt = FADE_INTERVAL if self.last_update is None else current_time - self.last_update
+        self.last_update = current_time
+        
+        # Update master volume from encoder (full level unless ENCODER_MASTER_VOLUME)
+        self.master_volume = self.volume_control.volume if ENCODER_MASTER_VOLUME else 1.0
+        
+        timeline = self.timeline
+        if log.due("trip", "status"):
+            if timeline.start_time is not None:
+                log.debug("trip", "status", total_time=current_time - timeline.start_time,
+                          frame_ride_time=timeline.ride_time, frame=timeline.frame_index + 1,
+                          stop_time=current_time - timeline.stop_counter if timeline.stop_counter else None,
+                          moving=is_moving, speed=current_speed, cadence=pedal.cadence, master_volume=self.master_volume)
+            else:
+                log.debug("trip", "status", moving=is_moving, speed=current_speed, cadence=pedal.cadence,
+                          master_volume=self.master_volume)
+        
+        timeline.update(current_time, current_speed, is_moving, self.master_volume, dt)
+    
+    def next_deadline(self, current_time):
+        """Time at which the trip must be evaluated again without any new input (None: wait for inputs)"""
+        return self.timeline.next_deadline(current_time, main_wheel.is_moving)
+
+class MainLoop:
+    """Body of the main loop: evaluate the trip on inputs and deadlines
+
+    step() is the same whatever drives it: run() with asyncio in the program, or
+    run_on_clock() with clock.wait(), which also works on a VirtualClock.
+    """
+    def __init__(self, legible):
+        self.legible = legible
+        self.last_snapshot = None
+        self.snapshot_key = None
+        self.running = False
+        self.wake = Event()
+    
+    def watch(self, notify):
+        """Call notify on every input: wheel edges, speed and stop changes, encoder turns"""
+        main_wheel.add_listener(notify)
+        self.legible.volume_control.add_listener(notify)
+    
+    def step(self, current_time):
+        """Evaluate the trip once, return the time of the next deadline (None: wait for inputs)"""
+        legible = self.legible
+        legible.update(current_time)
+        
+        # Snapshot the trip for a restart when it starts, stops, changes frame or the
+        # bike stops or moves again, and otherwise every RESUME_SNAPSHOT_INTERVAL
+        snapshot = legible.snapshot(current_time)
+        key = snapshot and (snapshot["frame"], snapshot["stopped_for"] is None)
+        if (key != self.snapshot_key or self.last_snapshot is None
+                or current_time - self.last_snapshot >= RESUME_SNAPSHOT_INTERVAL):
+            state.set("trip", snapshot)
+            self.snapshot_key = key
+            self.last_snapshot = current_time
+        
+        return legible.next_deadline(current_time)
+    
+    def run_on_clock(self):
+        """Run the loop on this thread, sleeping with clock.wait() until stop()"""
+        def notify():
+            self.wake.set()
+            clock.notify()
+        self.watch(notify)
+        self.running = True
+        while self.running:
+            self.wake.clear()
+            deadline = self.step(clock.now())
+            clock.wait(self.wake, None if deadline is None else max(0.0, deadline - clock.now()))
+    
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        clock.notify()
+
+async def run(main_loop):
+    """Run the loop with asyncio, waking on inputs and deadlines"""
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    
+    def notify():
+        # Called from the sensor threads, which can outlive the loop on exit
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+    
+    main_loop.watch(notify)
+    while True:
+        wake.clear()
+        deadline = main_loop.step(clock.now())
+        # A timer instead of asyncio.wait_for, which can swallow the cancellation of
+        # Ctrl+C when the wait finishes at the same time
+        timer = None if deadline is None else loop.call_later(max(0.0, deadline - clock.now()), wake.set)
+        await wake.wait()
+        if timer:
+            timer.cancel()
 
 def main():
     sound_manager = SoundManager()
     volume_control = VolumeEncoder()
     
-    # Start all sounds muted
-    sound_manager.start_all()
+    if is_simulated():
+        import ride_sim
+        ride_sim.start_from_config()
     
     print("\nStarting legible...")
     print("Press Ctrl+C to exit")
     
-    # Play sound "s1" at full volume (100%)
-    #sound_manager.play("s1", 100)  # Play sound "s1" at full volume
-    #print("Playing sound 's1' at full volume.")
-
-    start_time = None
-    last_active_time = time.time()
-    
-    first_frame_elapsed = 0
+    legible = Legible(sound_manager, volume_control)
+    # After a restart mid-trip, pick up where it was instead of starting over. The
+    # tracks start looping muted as they load, the trip only changes their volumes
+    legible.start(state.get("trip"), clock.now())
     
-    short_trip = 2
-    long_trip = 1
-    what_trip = long_trip
-
-    current_frame = 0
-    stop_counter = None
-
-    # Speed thresholds for long trip (km/h)
-    SLOW_MAX = 9
-    MEDIUM_MAX = 16
-    # Anything above MEDIUM_MAX is considered fast
-
-    # Volume targets for each sound
-    target_volumes = {
-        "bliss": 0.0,
-        "story": 0.0, 
-        "deconstruction": 0.0
-    }
-
-    # Current volumes for each sound
-    current_volumes = {
-        "bliss": 0.0,
-        "story": 0.0,
-        "deconstruction": 0.0
-    }
-
-    # Fade rate (volume change per iteration)
-    FADE_RATE = 0.0
-
-    # Initialize master volume
-    master_volume = DEFAULT_MASTER_VOLUME
-
     try:
-        while True:
-            current_speed = main_wheel.speed
-            is_moving = main_wheel.is_moving
-            current_time = time.time()
-
-            # Update master volume from encoder
-            master_volume = 1.0
-
-            if DEBUG_MODE:
-                print("\n=== Time Frame Status ===")
-                if start_time is not None:
-                    elapsed = current_time - start_time
-                    print(f"Total Time: {elapsed:.1f}s")
-                    print(f"Frame 1 Time: {first_frame_elapsed:.1f}s")
-                    print(f"Current Frame: {current_frame + 1}")
-                    if stop_counter:
-                        print(f"Stop Time: {current_time - stop_counter:.1f}s")
-                print(f"Moving: {is_moving}")
-                print(f"Speed: {current_speed:.1f} km/h")
-                print(f"Master Volume: {master_volume:.2f}")
-                print(f"\nCurrent Speed: {current_speed:.1f} km/h")
-                print(f"Moving: {is_moving}")
-
-            if what_trip == short_trip:
-                # [Original short_trip code remains exactly the same]
-                # Initialize start time when bike starts moving
-                if is_moving and start_time is None:
-                    start_time = current_time
-                    print("\n Bike started moving - beginning Time Frame 1")
-
-                if start_time is not None:
-                    elapsed_time = current_time - start_time
-
-                    # Handle stopping logic
-                    if not is_moving:
-                        if current_frame > 0:  # After Time Frame 1
-                            if stop_counter is None:  # Start 30s countdown
-                                stop_counter = current_time
-                                print("\n Bike stopped - 30s countdown started")
-                            elif current_time - stop_counter >= 30:  # Reset after 30s stopped
-                                print("\n Bike stopped for 30s - resetting everything")
-                                sound_manager.stop_all()
-                                start_time = None
-                                current_frame = 0
-                                stop_counter = None
-                                first_frame_elapsed = 0
-                                continue
-                        sound_manager.stop_all()
-                    else:
-                        stop_counter = None  # Reset stop counter if moving again
-
-                    # Time Frame 1 (0-30s): s1, s2, s3 with increasing volumes
-                    if first_frame_elapsed <= 30:
-                        if current_frame != 0:
-                            current_frame = 0
-                            print("\n Time Frame 1: Introducing sounds gradually")
-                        if is_moving:
-                            first_frame_elapsed += 0.1  # Only count time when moving
-                        volume = min(100, current_speed * 10) * master_volume  # Apply master volume
-                        
-                        # Stagger the sounds within the 30s
-                        if first_frame_elapsed <= 10:
-                            sound_manager.play("s1", volume)
-                            if DEBUG_MODE:
-                                print(f"Playing s1 at {volume:.0f}%")
-                        elif first_frame_elapsed <= 20:
-                            sound_manager.play("s1", volume)
-                            sound_manager.play("s2", volume)
-                            if DEBUG_MODE:
-                                print(f"Playing s1, s2 at {volume:.0f}%")
-                        else:
-                            sound_manager.play("s1", volume)
-                            sound_manager.play("s2", volume)
-                            sound_manager.play("s3", volume)
-                            if DEBUG_MODE:
-                                print(f"Playing s1, s2, s3 at {volume:.0f}%")
-
-                    # Time Frame 2 (30s-2m30s): s4 with base volume + speed boost
-                    elif elapsed_time <= 150:
-                        if current_frame != 1:
-                            current_frame = 1
-                            print("\n Time Frame 2: Speed-boosted s4")
-                            sound_manager.stop_all()
-                            sound_manager.start_all()
-                        
-                        if not is_moving:
-                            if stop_counter is None:  # Just stopped
-                                stop_counter = current_time
-                                print("\n Wheel stopped - muting sound (60s timeout)")
-                                sound_manager.play("s4", 0)  # Mute but don't stop
-                            elif current_time - stop_counter >= 60:  # 60s timeout
-                                print("\n Wheel stopped for 60s - resetting sequence")
-                                sound_manager.stop_all()
-                                start_time = None
-                                current_frame = 0
-                                stop_counter = None
-                                first_frame_elapsed = 0
-                                continue
-                        else:  # Wheel is moving
-                            stop_counter = None  # Reset stop counter
-                            base_vol = 60
-                            speed_boost = min(40, current_speed * 2)
-                            volume = min(100, base_vol + speed_boost) * master_volume  # Apply master volume
-                            sound_manager.play("s4", volume)
-                            if DEBUG_MODE:
-                                print(f"Playing s4 at {volume:.0f}% (base: {base_vol}%, boost: {speed_boost:.0f}%)")
-
-                    # Time Frame 3 (2m30s-4m30s): s5 with variable volume
-                    elif elapsed_time <= 270:
-                        if current_frame != 2:
-                            current_frame = 2
-                            print("\n Time Frame 3: Variable s5")
-                            sound_manager.stop_all()
-                            sound_manager.start_all()
-                        
-                        volume = max(40, min(100, 60 + current_speed * 2)) * master_volume  # Apply master volume
-                        sound_manager.play("s5", volume)
-                        if DEBUG_MODE:
-                            print(f"Playing s5 at {volume:.0f}%")
-
-                    else:  # After 4m30s, reset everything
-                        print("\n Sequence complete - resetting")
-                        sound_manager.stop_all()
-                        start_time = None
-                        current_frame = 0
-                        first_frame_elapsed = 0
-
-            elif what_trip == long_trip:
-                # Start all sounds if not already started
-                if is_moving and start_time is None:
-                    start_time = current_time
-                    sound_manager.stop_all()  # Stop any existing playback
-                    sound_manager.start_all()  # Start fresh playback
-                    sound_manager.play("s5", 0)  # bliss
-                    sound_manager.play("s6", 0)  # story
-                    sound_manager.play("s7", 0)  # deconstruction
-                    print("\n Long trip started - all sounds initialized")
-
-                if start_time is not None:
-                    # Handle stopping logic
-                    if not is_moving:
-                        if stop_counter is None:
-                            stop_counter = current_time
-                            print("\n Wheel stopped - starting 60s countdown")
-                        elif current_time - stop_counter >= 15:
-                            print("\n Wheel stopped for 60s - resetting sequence")
-                            sound_manager.stop_all()
-                            start_time = None  # Reset start time to trigger fresh start
-                            stop_counter = None
-                            # Reset all volumes
-                            for key in current_volumes:
-                                current_volumes[key] = 0.0
-                                target_volumes[key] = 0.0
-                            continue
-                        # Set all target volumes to 0 when stopped
-                        for key in target_volumes:
-                            target_volumes[key] = 0.0
-                    else:
-                        stop_counter = None
-                        # Set target volumes based on speed range
-                        if current_speed <= SLOW_MAX:
-                            target_volumes["bliss"] = 1.0
-                            target_volumes["story"] = 0.0
-                            target_volumes["deconstruction"] = 0.0
-                        elif current_speed <= MEDIUM_MAX:
-                            target_volumes["bliss"] = 0.0
-                            target_volumes["story"] = 1.0
-                            target_volumes["deconstruction"] = 0.0
-                        else:
-                            target_volumes["bliss"] = 0.0
-                            target_volumes["story"] = 0.0
-                            target_volumes["deconstruction"] = 1.0
-
-                    # Gradually adjust volumes
-                    for sound, target in target_volumes.items():
-                        if current_volumes[sound] < target:
-                            current_volumes[sound] = min(target, current_volumes[sound] + FADE_RATE)
-                        elif current_volumes[sound] > target:
-                            current_volumes[sound] = max(target, current_volumes[sound] - FADE_RATE)
-                        
-                        # Apply volumes with master volume
-                        if sound == "bliss":
-                            sound_manager.play("s5", current_volumes[sound] * 100 * master_volume)
-                        elif sound == "story":
-                            sound_manager.play("s6", current_volumes[sound] * 100 * master_volume)
-                        elif sound == "deconstruction":
-                            sound_manager.play("s7", current_volumes[sound] * 100 * master_volume)
-
-                    if DEBUG_MODE:
-                        print("\nCurrent Volumes:")
-                        print(f"Bliss: {current_volumes['bliss']:.2f}")
-                        print(f"Story: {current_volumes['story']:.2f}")
-                        print(f"Deconstruction: {current_volumes['deconstruction']:.2f}")
-
-            time.sleep(0.1)
-            
+        asyncio.run(run(MainLoop(legible)))
     except KeyboardInterrupt:
         print("\nStopping...")
         sound_manager.stop_all()
         pygame.quit()
     finally:
+        scheduler.stop()
         GPIO.cleanup()  # Ensure GPIO pins are released
 
 if __name__ == "__main__":
@@ -275,4 +215,4 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("Program interrupted. Cleaning up...")
     finally:
-        GPIO.cleanup()  # Ensure GPIO pins are released
\ No newline at end of file
+        GPIO.cleanup()  # Ensure GPIO pins are released
@@ -0,0 +1,142 @@
+# Sample-accurate mixer: sums the tracks with NumPy in the audio callback
+#
+# The control loop only posts target gains (Voice.set_volume); the callback moves each
+# gain towards its target one sample at a time, at most 1 / MIXER_RAMP_SECONDS per
+# second, so volume changes are smooth whatever the rate of the control loop.
+# Requires the sounddevice package (pip install sounddevice).
+
+import numpy as np
+from threading import Lock
+from config import *
+
+try:
+    import sounddevice
+except ImportError:
+    sounddevice = None
+
+# pygame mixer format -> sample type of the decoded PCM
+SAMPLE_TYPES = {
+    -16: (np.int16, 32768.0),
+    32: (np.float32, 1.0),
+}
+
+class Voice:
+    """One track of the mixer, with the same interface as a pygame Channel"""
+    def __init__(self, mixer):
+        self.mixer = mixer
+        self.samples = None
+        self.position = 0
+        self.loops = 0
+        self.gain = 0.0  # Gain applied to the last mixed sample
+        self.target = 0.0  # Gain posted by the control loop
+
+    def play(self, samples, loops=0):
+        with self.mixer.lock:
+            self.samples = samples
+            self.position = 0
+            self.loops = loops
+
+    def stop(self):
+        with self.mixer.lock:
+            self.samples = None
+
+    def set_volume(self, volume):
+        self.target = max(0.0, min(1.0, volume))
+
+    def get_volume(self):
+        return self.target
+
+    def get_busy(self):
+        return self.samples is not None
+
+    def _read(self, frames):
+        """Next frames samples as floats, looping or padding with silence at the end"""
+        samples = self.samples
+        end = self.position + frames
+        if end <= len(samples):
+            block = samples[self.position:end]
+            self.position = end
+        elif self.loops != 0:
+            indices = np.arange(self.position, end) % len(samples)
+            block = samples[indices]
+            self.position = end % len(samples)
+            if self.loops > 0:
+                self.loops -= 1
+        else:
+            block = np.zeros((frames, samples.shape[1]), dtype=samples.dtype)
+            block[:len(samples) - self.position] = samples[self.position:]
+            self.samples = None
+        return block.astype(np.float32) / self.mixer.scale
+
+    def _ramp(self, frames):
+        """Per-sample gains going from the current gain towards the target"""
+        if self.gain == self.target:
+            return None
+        steps = self.mixer.ramp_step * np.arange(1, frames + 1, dtype=np.float32)
+        if self.target > self.gain:
+            gains = np.minimum(self.gain + steps, self.target)
+        else:
+            gains = np.maximum(self.gain - steps, self.target)
+        self.gain = float(gains[-1])
+        return gains[:, None]
+
+class NumpyMixer:
+    def __init__(self, frequency, sample_format, channels, blocksize=MIXER_BLOCKSIZE):
+        if sounddevice is None:
+            raise ImportError("The numpy mixer backend requires the sounddevice package")
+        if sample_format not in SAMPLE_TYPES:
+            raise ValueError(f"Unsupported mixer format {sample_format}, expected one of {list(SAMPLE_TYPES)}")
+        self.frequency = frequency
+        self.channels = channels
+        self.blocksize = blocksize
+        self.sample_type, self.scale = SAMPLE_TYPES[sample_format]
+        self.ramp_step = 1.0 / (MIXER_RAMP_SECONDS * frequency)
+        self.voices = []
+        self.lock = Lock()
+        self.stream = None
+
+    def voice(self):
+        voice = Voice(self)
+        self.voices.append(voice)
+        return voice
+
+    def release(self, voice):
+        """Remove a voice from the mix, once its track is unloaded"""
+        with self.lock:
+            self.voices.remove(voice)
+
+    def load(self, pcm_path):
+        """Memory-map a decoded PCM file (see pcm_cache.py) as a (frames, channels) array"""
+        return np.memmap(pcm_path, dtype=self.sample_type, mode="r").reshape(-1, self.channels)
+
+    def mix(self, frames):
+        """Sum every playing voice into a (frames, channels) float32 block"""
+        out = np.zeros((frames, self.channels), dtype=np.float32)
+        with self.lock:
+            for voice in self.voices:
+                if voice.samples is None:
+                    continue
+                gains = voice._ramp(frames)
+                if gains is None and voice.gain == 0 and voice.loops != 0:
+                    # Muted looping voices keep their position without being mixed
+                    voice.position = (voice.position + frames) % len(voice.samples)
+                    continue
+                block = voice._read(frames)
+                out += block * (voice.gain if gains is None else gains)
+        np.clip(out, -1.0, 1.0, out=out)
+        return out
+
+    def _callback(self, outdata, frames, time, status):
+        outdata[:] = self.mix(frames)
+
+    def start(self):
+        self.stream = sounddevice.OutputStream(samplerate=self.frequency, channels=self.channels,
+                                               blocksize=self.blocksize, dtype="float32",
+                                               callback=self._callback)
+        self.stream.start()
+
+    def close(self):
+        if self.stream:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
@@ -1,6 +1,6 @@
 # The Legible project's main program
 
- from colorama import Fore, Back, Style
+from colorama import Fore, Back, Style
 
 print(Style.DIM, end="")
 import pygame
@@ -9,8 +9,8 @@ print(Style.RESET_ALL)
 import wheel_meter
 from config import *
 import time
-import numpy as np
 from hardware_controls import VolumeEncoder
+from curve_table import CurveTable
 
 pygame.mixer.init()
 
@@ -35,6 +35,16 @@ sounds = {
 
 print(Fore.GREEN + "Now playing. Time to get on the bike!" + Style.RESET_ALL)
 
+# Volume curve of each channel
+CURVE_NAMES = {
+    "abstract": "bliss",
+    "deconstr": "deconstruction",
+    "narrative": "story"
+}
+
+# Curves compiled once into a lookup table (call curve_table.compile() to swap them while running)
+curve_table = CurveTable({name: VOLUME_CURVES[CURVE_NAMES[name]] for name in channels})
+
 # Volume initialization
 current_volumes = {channel: 0.0 for channel in channels}
 
@@ -42,12 +52,8 @@ current_volumes = {channel: 0.0 for channel in channels}
 for name, channel in channels.items():
     channel.play(sounds[name], loops=-1, fade_ms=FADE_MS)
 
-def interpolate_volume(speed, curve):
-    speeds, volumes = zip(*curve)
-    return np.interp(speed * 100 / MAX_SPEED, speeds, volumes)
-
 def get_all_volumes(speed):
-    return [f"{interpolate_volume(wheel_meter.speed, VOLUME_CURVES[c]):.2f}" for c in channels]
+    return [f"{volume:.2f}" for volume in curve_table.volumes(speed)]
 
 def pygame_loop():
     running = True
@@ -55,10 +61,11 @@ def pygame_loop():
     last_volumes = {channel: 0.0 for channel in channels}
     
     while running:
-        target_volumes = {channel: interpolate_volume(wheel_meter.speed, VOLUME_CURVES[channel]) for channel in channels}
+        # All the target volumes in one lookup, in the order of curve_table.names
+        target_volumes = curve_table.volumes(wheel_meter.speed)
 
-        for name, channel in channels.items():
-            current_volumes[name] += (target_volumes[name] - current_volumes[name]) * LERP_SPEED
+        for (name, channel), target in zip(channels.items(), target_volumes):
+            current_volumes[name] += (target - current_volumes[name]) * LERP_SPEED
             # Apply master volume from encoder
             final_volume = current_volumes[name] * volume_control.volume
             channel.set_volume(final_volume)
@@ -0,0 +1,96 @@
+# On-disk cache of decoded audio, so SoundManager doesn't decode every MP3 on boot
+#
+# Each track is stored as raw PCM in the mixer's sample format. A cache file is only
+# used when the source file (size and modification time) and the mixer settings
+# (frequency, format, channels) are the ones it was decoded with; otherwise the MP3
+# is decoded again and the cache replaced.
+#
+# Usage:
+#   python pcm_cache.py    Warm the cache for every file in Audios/ ahead of time
+
+import glob
+import hashlib
+import mmap
+import os
+import pygame
+from track_registry import TrackRegistry
+from config import *
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def cache_dir():
+    return os.path.join(CURRENT_DIR, PCM_CACHE_DIR)
+
+def cache_key(source_path):
+    """Identify a decoded file: the source's size and mtime plus the mixer settings"""
+    stat = os.stat(source_path)
+    frequency, sample_format, channels = pygame.mixer.get_init()
+    description = f"{stat.st_size}:{stat.st_mtime_ns}:{frequency}:{sample_format}:{channels}"
+    return hashlib.sha1(description.encode()).hexdigest()[:16]
+
+def cache_path(source_path):
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(cache_dir(), f"{name}.{cache_key(source_path)}.pcm")
+
+def load_sound(source_path):
+    """Return a pygame Sound for source_path, from the cache when it is up to date"""
+    path = cache_path(source_path)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return pygame.mixer.Sound(buffer=data)
+
+    sound = pygame.mixer.Sound(source_path)
+    try:
+        store(source_path, sound)
+    except OSError as e:
+        print(f"Could not cache {source_path}: {e}")
+    return sound
+
+def ensure(source_path):
+    """Return the path of the up to date cache file of source_path, decoding it if needed"""
+    path = cache_path(source_path)
+    if not os.path.exists(path):
+        store(source_path, pygame.mixer.Sound(source_path))
+    return path
+
+def store(source_path, sound):
+    """Write the decoded samples of sound to the cache, replacing stale versions"""
+    os.makedirs(cache_dir(), exist_ok=True)
+    path = cache_path(source_path)
+    name = os.path.splitext(os.path.basename(source_path))[0]
+
+    # Write to a temporary file first so a power cut never leaves a truncated cache
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(sound.get_raw())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    # Make the rename itself durable
+    directory = os.open(cache_dir(), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+    for stale in glob.glob(os.path.join(cache_dir(), f"{name}.*.pcm")):
+        if stale != path:
+            os.remove(stale)
+
+def warm(tracks_path=os.path.join(CURRENT_DIR, "Audios")):
+    """Decode every track of tracks_path (as SoundManager finds them) whose cache is missing or stale"""
+    registry = TrackRegistry(tracks_path)
+    for source_path in (registry.path(name) for name in registry.names):
+        if os.path.exists(cache_path(source_path)):
+            print(f"= {os.path.basename(source_path)} is up to date")
+            continue
+        store(source_path, pygame.mixer.Sound(source_path))
+        print(f"+ Cached {os.path.basename(source_path)}")
+
+if __name__ == "__main__":
+    # Use the same mixer settings as SoundManager, so the cache matches at boot
+    pygame.mixer.init()
+    print(f"Mixer settings: {pygame.mixer.get_init()}")
+    warm()
+    pygame.mixer.quit()
@@ -0,0 +1,204 @@
+# Replays recorded or synthetic ride traces on the simulated GPIO pins (see sim_gpio.py)
+#
+# Usage:
+#   python ride_sim.py record ride.csv               Record the sensors of a real ride (on the Pi)
+#   python ride_sim.py profile speeds.csv ride.csv   Turn a speed profile into an edge trace
+#
+# A trace is a CSV file of "time,pin,value" lines, time in seconds from the start of
+# the ride and value 1 when the sensor/button becomes active, 0 when it is released.
+# A speed profile is a CSV file of "time,speed_kmh,cadence_rpm" lines; speeds and
+# cadences are interpolated linearly between the lines.
+
+import csv
+import os
+import sys
+from math import pi
+from threading import Thread
+from time import monotonic
+from clock import now, sleep
+from config import *
+import sim_gpio
+
+PULSE_WIDTH = 0.01  # How long (in seconds) a magnet keeps a Hall sensor active
+PROFILE_STEP = 0.002  # Integration step (in seconds) used to turn profiles into edges
+
+def load_trace(path):
+    """Load a recorded trace as a sorted list of (time, pin, value)"""
+    events = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#") or row[0] == "time":
+                continue
+            events.append((float(row[0]), int(row[1]), int(row[2])))
+    events.sort(key=lambda event: event[0])
+    return events
+
+def load_profile(path):
+    """Load a speed profile as a list of (time, speed_kmh, cadence_rpm)"""
+    profile = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#") or row[0] == "time":
+                continue
+            cadence = float(row[2]) if len(row) > 2 else 0.0
+            profile.append((float(row[0]), float(row[1]), cadence))
+    profile.sort(key=lambda point: point[0])
+    return profile
+
+def constant_profile(speed_kmh, cadence_rpm, duration, stop_after=0):
+    """Profile for a ride at constant speed, optionally followed by a stop"""
+    profile = [(0, speed_kmh, cadence_rpm), (duration, speed_kmh, cadence_rpm)]
+    if stop_after:
+        profile += [(duration, 0, 0), (duration + stop_after, 0, 0)]
+    return profile
+
+def _pulse(events, time, pin):
+    events.append((time, pin, 1))
+    events.append((time + PULSE_WIDTH, pin, 0))
+
+def profile_events(profile, wheel_diameter_mm=DEFAULT_DIAMETER, magnets=WHEEL_MAGNETS, magnet_positions=None):
+    """Generate the wheel and pedal sensor edges produced by riding a speed profile
+
+    magnet_positions (fractions of a revolution) places the wheel magnets unevenly,
+    by default they are evenly spaced.
+    """
+    events = []
+    circum_m = wheel_diameter_mm * pi / 1000
+    positions = magnet_positions or [i / magnets for i in range(magnets)]
+    # Distance from each magnet to the next one
+    arcs = [((positions[(i + 1) % len(positions)] - position) % 1 or 1) * circum_m
+            for i, position in enumerate(positions)]
+    magnet = 0
+    # Fraction of a pedal revolution between the two pedal sensors
+    sensor_gap = PEDAL_SENSOR_DISTANCE / (2 * pi * PEDAL_RADIUS)
+    wheel_distance = 0.0
+    crank_turns = 0.0
+    second_sensor_due = None
+
+    for (t0, speed0, cadence0), (t1, speed1, cadence1) in zip(profile, profile[1:]):
+        t = t0
+        while t < t1:
+            ratio = (t - t0) / (t1 - t0)
+            speed = speed0 + (speed1 - speed0) * ratio
+            cadence = cadence0 + (cadence1 - cadence0) * ratio
+
+            wheel_distance += speed / 3.6 * PROFILE_STEP
+            if wheel_distance >= arcs[magnet]:
+                wheel_distance -= arcs[magnet]
+                magnet = (magnet + 1) % len(arcs)
+                _pulse(events, t, PIN)
+
+            # Riding forward, the pedal magnet passes sensor 2 then sensor 1
+            crank_turns += cadence / 60 * PROFILE_STEP
+            if crank_turns >= 1:
+                crank_turns -= 1
+                _pulse(events, t, PEDAL_PIN2)
+                second_sensor_due = crank_turns + sensor_gap
+            if second_sensor_due is not None and crank_turns >= second_sensor_due:
+                _pulse(events, t, PEDAL_PIN1)
+                second_sensor_due = None
+
+            t += PROFILE_STEP
+
+    events.sort(key=lambda event: event[0])
+    return events
+
+def encoder_events(start_time, steps, step_time=0.02):
+    """Quadrature edges of the volume encoder turning steps detents (negative: counter-clockwise)"""
+    events = []
+    if steps > 0:
+        sequence = [(1, 0), (1, 1), (0, 1), (0, 0)]
+    else:
+        sequence = [(0, 1), (1, 1), (1, 0), (0, 0)]
+    t = start_time
+    for _ in range(abs(steps)):
+        for clk, dt in sequence:
+            events.append((t, ENCODER_CLK, clk))
+            events.append((t, ENCODER_DT, dt))
+            t += step_time / len(sequence)
+    return events
+
+class RideSimulator:
+    """Drives the simulated pins from a list of (time, pin, value) events"""
+    def __init__(self, events):
+        self.events = sorted(events, key=lambda event: event[0])
+        self.running = False
+        self.finished = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self._replay, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    def _replay(self):
+        start = now()
+        for event_time, pin, value in self.events:
+            delay = start + event_time - now()
+            if delay > 0:
+                sleep(delay)
+            if not self.running:
+                return
+            sim_gpio.set_level(pin, value)
+        self.finished = True
+
+def start_from_config():
+    """Start replaying SIM_TRACE or SIM_PROFILE (LEGIBLE_TRACE/LEGIBLE_PROFILE override them)"""
+    trace_path = os.environ.get("LEGIBLE_TRACE", SIM_TRACE)
+    profile_path = os.environ.get("LEGIBLE_PROFILE", SIM_PROFILE)
+    if trace_path:
+        events = load_trace(trace_path)
+        print(f"Replaying ride trace {trace_path} ({len(events)} events)")
+    elif profile_path:
+        events = profile_events(load_profile(profile_path))
+        print(f"Replaying speed profile {profile_path} ({len(events)} events)")
+    else:
+        print("Simulation: no trace or profile configured, pins stay idle")
+        return None
+    simulator = RideSimulator(events)
+    simulator.start()
+    return simulator
+
+def save_trace(events, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "pin", "value"])
+        for event_time, pin, value in events:
+            writer.writerow([f"{event_time:.4f}", pin, value])
+
+def record(path):
+    """Record the sensor and encoder edges of a real ride into a trace file"""
+    from gpiozero import Button
+    from signal import pause
+
+    events = []
+    start = monotonic()
+    devices = [Button(pin, bounce_time=BOUNCE_TIME) for pin in (PIN, PEDAL_PIN1, PEDAL_PIN2)]
+    devices += [Button(pin, pull_up=False) for pin in (ENCODER_CLK, ENCODER_DT, ENCODER_SW)]
+    for device in devices:
+        pin = device.pin.number
+        device.when_pressed = lambda pin=pin: events.append((monotonic() - start, pin, 1))
+        device.when_released = lambda pin=pin: events.append((monotonic() - start, pin, 0))
+
+    print(f"Recording to {path}, press Ctrl+C to stop")
+    try:
+        pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        save_trace(events, path)
+        print(f"\nSaved {len(events)} events")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "record":
+        record(sys.argv[2])
+    elif len(sys.argv) == 4 and sys.argv[1] == "profile":
+        save_trace(profile_events(load_profile(sys.argv[2])), sys.argv[3])
+    else:
+        print("Usage: python ride_sim.py record <trace.csv>")
+        print("       python ride_sim.py profile <profile.csv> <trace.csv>")
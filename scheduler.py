@@ -0,0 +1,128 @@
+# Shared scheduler: one thread runs the periodic and one-shot tasks of every component
+#
+# Tasks are kept in a hashed timer wheel of SCHEDULER_SLOTS slots, SCHEDULER_TICK
+# seconds each. The thread sleeps until the earliest task is due (or a new, earlier
+# task is added), runs every task of the elapsed ticks and reschedules the periodic ones.
+
+import atexit
+from math import ceil
+from threading import Thread, Lock, Event
+import clock
+from config import *
+
+class Task:
+    def __init__(self, callback, deadline, interval=None, name=None):
+        self.callback = callback
+        self.deadline = deadline
+        self.interval = interval  # None for one-shot tasks
+        self.name = name or getattr(callback, "__name__", "task")
+        self.tick = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler:
+    def __init__(self, tick=SCHEDULER_TICK, slots=SCHEDULER_SLOTS):
+        self.tick = tick
+        self.wheel = [[] for _ in range(slots)]
+        self.start_time = None  # Set by the first task, so a clock installed after import is used
+        self.current_tick = 0  # Last tick whose tasks were run
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.running = False
+        self.thread = None
+
+    def every(self, interval, callback, name=None, delay=None):
+        """Run callback every interval seconds (first run after delay, default interval)"""
+        deadline = clock.now() + (interval if delay is None else delay)
+        return self._add(Task(callback, deadline, interval, name))
+
+    def after(self, delay, callback, name=None):
+        """Run callback once, delay seconds from now"""
+        return self._add(Task(callback, clock.now() + delay, None, name))
+
+    def _add(self, task):
+        with self.lock:
+            self._insert(task)
+        if not self.running:
+            self.start()
+        # Let the thread shorten its sleep if this task is due first
+        self.wakeup.set()
+        clock.notify()
+        return task
+
+    def _insert(self, task):
+        if self.start_time is None:
+            self.start_time = clock.now()
+        task.tick = max(ceil((task.deadline - self.start_time) / self.tick - 1e-6), self.current_tick + 1)
+        self.wheel[task.tick % len(self.wheel)].append(task)
+
+    def _next_deadline(self):
+        ticks = [task.tick for slot in self.wheel for task in slot]
+        if not ticks:
+            return None
+        return self.start_time + min(ticks) * self.tick
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.thread = Thread(target=self._run, name="scheduler", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the thread; pending tasks are dropped"""
+        self.running = False
+        self.wakeup.set()
+        clock.notify()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def _run(self):
+        while self.running:
+            with self.lock:
+                deadline = self._next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - clock.now())
+            clock.wait(self.wakeup, timeout)
+            self.wakeup.clear()
+            if not self.running:
+                return
+
+            for task in self._collect_due():
+                try:
+                    task.callback()
+                except Exception as e:
+                    print(f"Error in scheduled task {task.name}: {e}")
+                if task.interval is not None and not task.cancelled:
+                    with self.lock:
+                        # Skip the missed runs of a late task instead of running them in a burst
+                        task.deadline = max(task.deadline + task.interval, clock.now())
+                        self._insert(task)
+
+    def _collect_due(self):
+        """Remove and return the tasks of every tick up to now"""
+        due = []
+        with self.lock:
+            # The margin keeps a wake-up exactly on a tick boundary from rounding down
+            now_tick = int((clock.now() - self.start_time) / self.tick + 1e-6)
+            if now_tick <= self.current_tick:
+                return due
+            # A whole turn of the wheel covers every slot once
+            first = max(self.current_tick + 1, now_tick - len(self.wheel) + 1)
+            for tick in range(first, now_tick + 1):
+                slot = self.wheel[tick % len(self.wheel)]
+                keep = []
+                for task in slot:
+                    if task.cancelled:
+                        continue
+                    (due if task.tick <= now_tick else keep).append(task)
+                slot[:] = keep
+            self.current_tick = now_tick
+        due.sort(key=lambda task: task.deadline)
+        return due
+
+scheduler = Scheduler()
@@ -0,0 +1,129 @@
+# Simulated stand-ins for the gpiozero devices and RPi.GPIO used by the project
+
+from threading import Lock
+from clock import now
+
+# Logical state of every simulated pin (1 = active: magnet present, button pressed)
+_levels = {}
+_buttons = {}
+_edge_callbacks = {}  # pin -> (edge, callback) registered with GPIO.add_event_detect
+_lock = Lock()
+
+def set_level(pin, value):
+    """Drive a simulated pin, firing the callbacks of the device attached to it"""
+    with _lock:
+        previous = _levels.get(pin, 0)
+        _levels[pin] = value
+        button = _buttons.get(pin)
+        edge_callback = _edge_callbacks.get(pin)
+    if value == previous:
+        return
+    if button:
+        button._changed(value)
+    if edge_callback:
+        edge, callback = edge_callback
+        if edge == GPIO.BOTH or (edge == GPIO.RISING) == bool(value):
+            callback(pin)
+
+def get_level(pin):
+    return _levels.get(pin, 0)
+
+def reset():
+    """Forget every pin and device (used between simulated runs)"""
+    with _lock:
+        _levels.clear()
+        _buttons.clear()
+        _edge_callbacks.clear()
+
+class Button:
+    """Simulated gpiozero.Button"""
+    def __init__(self, pin, bounce_time=None, **kwargs):
+        self.pin = pin
+        self.bounce_time = bounce_time or 0
+        self.when_pressed = None
+        self.when_released = None
+        self._last_change = None
+        with _lock:
+            _buttons[pin] = self
+
+    @property
+    def is_pressed(self):
+        return bool(get_level(self.pin))
+
+    @property
+    def value(self):
+        return int(self.is_pressed)
+
+    def _changed(self, value):
+        current_time = now()
+        if self._last_change is not None and current_time - self._last_change < self.bounce_time:
+            return
+        self._last_change = current_time
+        callback = self.when_pressed if value else self.when_released
+        if callback:
+            callback()
+
+    def close(self):
+        with _lock:
+            if _buttons.get(self.pin) is self:
+                del _buttons[self.pin]
+
+class DigitalOutputDevice:
+    """Simulated gpiozero.DigitalOutputDevice"""
+    def __init__(self, pin, **kwargs):
+        self.pin = pin
+        self.value = 0
+
+    def on(self):
+        self.value = 1
+
+    def off(self):
+        self.value = 0
+
+    def close(self):
+        self.off()
+
+class PWMLED(DigitalOutputDevice):
+    """Simulated gpiozero.PWMLED (value is the brightness, 0-1)"""
+    def __init__(self, pin, frequency=100, **kwargs):
+        super().__init__(pin)
+        self.frequency = frequency
+        self.value = 0.0
+
+class _GPIO:
+    """Simulated RPi.GPIO module (only the parts the project uses)"""
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        _levels.setdefault(pin, 0)
+
+    def input(self, pin):
+        return get_level(pin)
+
+    def output(self, pin, value):
+        set_level(pin, value)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with _lock:
+            _edge_callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        with _lock:
+            _edge_callbacks.pop(pin, None)
+
+    def cleanup(self, pins=None):
+        pass
+
+GPIO = _GPIO()
@@ -1,63 +1,360 @@
 import os
 import pygame
+import clock
+import pcm_cache
+from queue import Queue
+from threading import Lock, Thread
+from scheduler import scheduler
+from track_registry import TrackRegistry
 from config import *
+from event_log import log
+
+class StreamingTrack:
+    """A looping track played chunk by chunk from its PCM cache file
+
+    Only the playing chunk and the one queued after it are held in memory, so a
+    track of any length costs about 2 * STREAM_CHUNK_SECONDS of audio.
+    """
+    def __init__(self, source_path):
+        self.path = pcm_cache.ensure(source_path)
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        frame_size = channels * abs(sample_format) // 8
+        self.chunk_size = int(frequency * STREAM_CHUNK_SECONDS) * frame_size
+        self.length = os.path.getsize(self.path) // frame_size * frame_size
+        self.file = open(self.path, "rb")
+        self.offset = 0
+        self.channel = None
+        self.lock = Lock()  # start() and feed() run on different threads
+    
+    def _next_chunk(self):
+        # Always a whole chunk: at the end of the track it goes on from the start, so no
+        # short chunk can run out between two feed() calls
+        data = b""
+        while len(data) < self.chunk_size:
+            self.file.seek(self.offset)
+            part = self.file.read(min(self.chunk_size - len(data), self.length - self.offset))
+            data += part
+            self.offset += len(part)
+            if self.offset >= self.length:
+                self.offset = 0  # Loop
+        return pygame.mixer.Sound(buffer=data)
+    
+    def start(self, channel):
+        """Start playing from the beginning on channel"""
+        with self.lock:
+            self.channel = channel
+            self.offset = 0
+            channel.play(self._next_chunk())
+            channel.queue(self._next_chunk())
+    
+    def stop(self):
+        with self.lock:
+            self.channel = None
+    
+    def feed(self):
+        """Queue the next chunk once the queued one started playing"""
+        with self.lock:
+            if not self.channel:
+                return
+            if not self.channel.get_busy():
+                # Both chunks ran out before this call (a late feed): play again from here
+                self.channel.play(self._next_chunk())
+            if self.channel.get_queue() is None:
+                self.channel.queue(self._next_chunk())
+    
+    def close(self):
+        self.stop()
+        self.file.close()
+    
+    def get_length(self):
+        return self.length / self.chunk_size * STREAM_CHUNK_SECONDS
 
 class SoundManager:
+    """Plays the tracks of the registry, each on its own channel
+
+    A track is loaded the first time it is needed (use(), prefetch(), play() or
+    restart()) and starts looping muted right away, so the trips only change its
+    volume. Beyond TRACK_MEMORY_BUDGET_MB, the least recently used tracks that are
+    neither in use, about to be used nor audible are unloaded.
+    """
     def __init__(self):
         if not pygame.mixer.get_init():
             pygame.mixer.init()
         
-        # Load sound files
+        # Find the sound files
         current_dir = os.path.dirname(os.path.abspath(__file__))
         self.tracks_path = os.path.join(current_dir, "Audios")
-        print(f"Loading audio files from: {self.tracks_path}")
+        self.registry = TrackRegistry(self.tracks_path)
         print(f"Audio files are located at: {self.tracks_path}")
+        print(f"Tracks: {', '.join(self.registry.names) or 'none'}")
         
         # Create dictionary to store sounds and channels
         self.sounds = {}
         self.channels = {}
         self.volumes = {}
+        self.targets = {}
+        self.last_played = {}
+        self.outputs = {}  # Volume last sent to each channel
+        self.sent_updates = 0
+        self.skipped_updates = 0  # Volume updates not sent because the output didn't change
+        self.streams = {}
+        self.stream_task = None
+        self.channel_indices = {}  # Name -> pygame mixer channel
+        self.free_channels = []  # Mixer channels released by unloaded tracks
+        self.channel_count = 0
+        self.lock = Lock()  # The tables change on the prefetch thread
+        self.load_lock = Lock()  # One track is decoded at a time
+        self.in_use = set()
+        self.upcoming = set()
+        self.prefetch_queue = Queue()
+        self.prefetch_thread = None
         
-        # Load 8 sounds and create their channels
-        for i in range(1, 9):
-            sound_name = f"s{i}"
-            sound_path = os.path.join(self.tracks_path, f"{sound_name}.mp3")
-            
+        # With the numpy backend, pygame only decodes the tracks into the PCM cache,
+        # when they are first loaded (a cached track is only mapped from its file)
+        self.mixer = None
+        if MIXER_BACKEND == "numpy":
+            from numpy_mixer import NumpyMixer
+            settings = pygame.mixer.get_init()
+            self.mixer = NumpyMixer(*settings)
+            # Release the audio device for the NumPy mixer's output stream, and reopen
+            # pygame's mixer with the same settings on SDL's dummy driver, to decode
+            pygame.mixer.quit()
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+            pygame.mixer.init(*settings)
+            self.mixer.start()
+    
+    def _decode(self, name):
+        """Load the samples of a track, return them with the memory they take"""
+        sound_path = self.registry.path(name)
+        if self.mixer:
+            # Memory-mapped, so long tracks don't need streaming
+            samples = self.mixer.load(pcm_cache.ensure(sound_path))
+            return samples, samples.nbytes
+        if USE_STREAMING and os.path.getsize(sound_path) >= STREAM_THRESHOLD_MB * 1024 * 1024:
+            stream = StreamingTrack(sound_path)
+            return stream, 2 * stream.chunk_size
+        if USE_PCM_CACHE:
+            sound = pcm_cache.load_sound(sound_path)
+        else:
+            sound = pygame.mixer.Sound(sound_path)
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        return sound, int(sound.get_length() * frequency) * channels * abs(sample_format) // 8
+    
+    def _allocate_channel(self, name):
+        if self.mixer:
+            return self.mixer.voice()
+        if self.free_channels:
+            index = self.free_channels.pop()
+        else:
+            index = self.channel_count
+            self.channel_count += 1
+            if pygame.mixer.get_num_channels() < self.channel_count:
+                pygame.mixer.set_num_channels(self.channel_count)
+        self.channel_indices[name] = index
+        return pygame.mixer.Channel(index)
+    
+    def _release_channel(self, name, channel):
+        if self.mixer:
+            self.mixer.release(channel)
+        else:
+            self.free_channels.append(self.channel_indices.pop(name))
+    
+    def _load(self, name):
+        """Load a track and start it looping muted, return whether it is loaded"""
+        with self.load_lock:
+            if name in self.channels:
+                return True
             try:
-                self.sounds[sound_name] = pygame.mixer.Sound(sound_path)
-                self.channels[sound_name] = pygame.mixer.Channel(i-1)
-                self.volumes[sound_name] = 0.0
-                print(f"+ Loaded {sound_name}")
-            except FileNotFoundError:
-                print(f"- Could not find {sound_path}")
+                sound, size = self._decode(name)
+            except (FileNotFoundError, KeyError):
+                print(f"- Could not find {self.registry.paths.get(name, name)}")
+                self.registry.paths.pop(name, None)  # Don't try again on every play()
+                return False
+            except (pygame.error, OSError, ValueError) as e:
+                print(f"- Could not decode {self.registry.path(name)}: {e}")
+                self.registry.paths.pop(name, None)
+                return False
+            with self.lock:
+                channel = self._allocate_channel(name)
+                self.sounds[name] = sound
+                self.volumes[name] = 0.0
+                self.targets[name] = 0.0
+                self._start(sound, channel)
+                self._send(name, channel, 0.0)
+                if isinstance(sound, StreamingTrack):
+                    self.streams[name] = sound
+                    if self.stream_task is None:
+                        # Keep the streamed tracks fed with chunks
+                        self.stream_task = scheduler.every(STREAM_CHUNK_SECONDS / 4, self._feed_streams)
+                self.channels[name] = channel
+            self.registry.add(name, size)
+        print(f"+ Loaded {name}{' (streamed)' if name in self.streams else ''}")
+        self._evict()
+        return True
+    
+    def _unload(self, name):
+        with self.lock:
+            channel = self.channels.pop(name)
+            sound = self.sounds.pop(name)
+            if self.streams.pop(name, None):
+                sound.close()  # Before stopping the channel, or feed() would play it again
+            channel.stop()
+            del self.volumes[name], self.targets[name]
+            self.last_played.pop(name, None)
+            self.outputs.pop(name, None)
+            self._release_channel(name, channel)
+        self.registry.remove(name)
+        print(f"- Unloaded {name}")
+    
+    def _evict(self):
+        """Unload the least recently used tracks while the loaded ones take more than the budget"""
+        with self.lock:
+            keep = self.in_use | self.upcoming
+            keep.update(name for name in self.volumes if self.volumes[name] or self.targets[name])
+        for name in self.registry.to_evict(keep):
+            self._unload(name)
+    
+    def _loaded(self, name):
+        """Whether a track is loaded, loading it now if it exists"""
+        return name in self.channels or (name in self.registry.paths and self._load(name))
+    
+    def use(self, *names):
+        """Load the tracks the trip plays now (the others may be unloaded)"""
+        self.in_use = set(names)
+        self.upcoming -= self.in_use
+        for name in names:
+            if name not in self.registry.paths:
+                print(f"- No track called {name} in {self.tracks_path}")
+            elif name not in self.channels:
+                self._load(name)
+            else:
+                self.registry.used(name)
+        self._evict()
+    
+    def prefetch(self, *names):
+        """Load tracks in the background, ahead of the part of the trip that plays them"""
+        self.upcoming = set(names) - self.in_use
+        for name in self.upcoming:
+            if name in self.registry.paths and name not in self.channels:
+                if self.prefetch_thread is None:
+                    self.prefetch_thread = Thread(target=self._prefetch_loop, daemon=True)
+                    self.prefetch_thread.start()
+                self.prefetch_queue.put(name)
+    
+    def _prefetch_loop(self):
+        while True:
+            name = self.prefetch_queue.get()
+            try:
+                self._load(name)
+            except Exception as e:
+                # The next tracks must still be prefetched
+                print(f"- Could not prefetch {name}: {e}")
+    
+    def _feed_streams(self):
+        for stream in tuple(self.streams.values()):
+            stream.feed()
+    
+    def _start(self, sound, channel):
+        if isinstance(sound, StreamingTrack):
+            sound.start(channel)
+        else:
+            channel.play(sound, loops=-1)
     
     def start_all(self):
         """Start playing all loaded sounds (muted)"""
-        for name in self.sounds:
-            self.channels[name].play(self.sounds[name], loops=-1)
-            self.channels[name].set_volume(0)
+        with self.lock:
+            for name, channel in self.channels.items():
+                self._start(self.sounds[name], channel)
+                self._send(name, channel, 0.0)
+    
+    def restart(self, *names):
+        """Play the named sounds again from their start, keeping their volume"""
+        for name in names:
+            if not self._loaded(name):
+                continue
+            with self.lock:
+                if name in self.channels:
+                    channel = self.channels[name]
+                    self._start(self.sounds[name], channel)
+                    self._send(name, channel, self.volumes[name] * MASTER_VOLUME)
+    
+    def mute_all(self):
+        """Silence all sounds at once, leaving them playing so they can come back without a restart"""
+        with self.lock:
+            for name, channel in self.channels.items():
+                if self.volumes[name] or self.targets[name]:
+                    self.volumes[name] = 0.0
+                    self.targets[name] = 0.0
+                    self._send(name, channel, 0.0)
     
     def stop_all(self):
         """Stop all sounds"""
-        for name in self.channels:
-            self.channels[name].stop()
+        with self.lock:
+            for name in self.channels:
+                if name in self.streams:
+                    self.streams[name].stop()
+                self.channels[name].stop()
+    
+    def _send(self, name, channel, output):
+        channel.set_volume(output)
+        self.outputs[name] = output
+        self.sent_updates += 1
     
     def play(self, sound_name: str, volume: float):
         """Play a sound at specified volume (0-100)"""
-        if sound_name in self.channels:
-            # Apply LERP for smooth transition
-            self.volumes[sound_name] += (
-                (volume/100.0) - self.volumes[sound_name]
-            ) * LERP_SPEED
-            self.channels[sound_name].set_volume(self.volumes[sound_name] * MASTER_VOLUME)
-            
-            if DEBUG_MODE and DEBUG_SOUND:
-                channel = self.channels[sound_name]
-                print(f"\n=== {sound_name} Status ===")
-                print(f"Playing: {'Yes' if channel.get_busy() else 'No'}")
-                print(f"Target Volume: {volume:.0f}%")
-                print(f"Current Volume: {self.volumes[sound_name]*100:.0f}%")
-                print(f"Actual Volume: {channel.get_volume()*100:.0f}%")
+        self.set_gains({sound_name: volume})
+    
+    def set_gains(self, gains):
+        """Move several sounds towards their volume (0-100) at once, {name: volume}
+
+        A channel is only updated when its output volume changed by GAIN_EPSILON or
+        more, or reached its target; skipped_updates counts the updates saved.
+        """
+        names = [name for name in gains if self._loaded(name)]
+        if not names:
+            return
+        self.registry.used(*names)
+        current_time = clock.now()
+        last_dt = factor = None
+        with self.lock:
+            for name in names:
+                channel = self.channels.get(name)
+                if channel is None:
+                    continue  # Unloaded meanwhile
+                target = gains[name] / 100.0
+                self.targets[name] = target
+                if self.mixer:
+                    # The mixer ramps the gain per sample, only post the target
+                    volume = target
+                else:
+                    # Apply LERP for smooth transition, scaled to the time since the last call
+                    # (one LERP_SPEED step per FADE_INTERVAL, whatever the call rate); the
+                    # sounds updated together share the same step
+                    dt = min(FADE_INTERVAL, current_time - self.last_played.get(name, current_time - FADE_INTERVAL))
+                    self.last_played[name] = current_time
+                    if dt != last_dt:
+                        last_dt = dt
+                        factor = 1 - (1 - LERP_SPEED) ** (dt / FADE_INTERVAL)
+                    volume = self.volumes[name] + (target - self.volumes[name]) * factor
+                    if abs(target - volume) < FADE_EPSILON:
+                        volume = target
+                self.volumes[name] = volume
+                
+                output = volume * MASTER_VOLUME
+                sent = self.outputs.get(name)
+                if output == sent or (volume != target and sent is not None and abs(output - sent) < GAIN_EPSILON):
+                    self.skipped_updates += 1
+                else:
+                    self._send(name, channel, output)
+                
+                if log.due("sound", "status", name):
+                    log.debug("sound", "status", name=name, playing=channel.get_busy(), target=target*100,
+                              current=volume*100, actual=channel.get_volume()*100)
+    
+    def is_fading(self):
+        """Whether a sound still needs play() calls to reach its target volume"""
+        with self.lock:
+            return any(self.volumes[name] != self.targets[name] for name in self.volumes)
     
     def set_master_volume(self, volume: float):
         """Set master volume (0-100)"""
@@ -69,8 +366,10 @@ class SoundManager:
         if DEBUG_MODE and DEBUG_SOUND:
             print("\n=== Sound System Status ===")
             print(f"Master Volume: {MASTER_VOLUME*100:.0f}%")
+            print(f"Loaded Tracks: {len(self.channels)} ({self.registry.memory / (1024 * 1024):.0f} MB)")
+            print(f"Volume Updates: {self.sent_updates} sent, {self.skipped_updates} skipped")
             print("\nActive Channels:")
-            for name, channel in self.channels.items():
+            for name, channel in tuple(self.channels.items()):
                 if channel.get_busy():
                     print(f"\n{name}:")
                     print(f"  Playing: Yes")
@@ -0,0 +1,139 @@
+# Speed estimation from sensor edge timestamps
+
+from statistics import median
+
+# Constants
+from config import *
+
+class EdgeBuffer:
+    """Fixed-size ring buffer of sensor edge timestamps (oldest are overwritten)
+
+    push() must only be called from one thread (the sensor callback). It fills a
+    slot, then publishes it by bumping count, which doubles as the sequence number
+    of the next edge. Readers never lock: snapshot() copies the slots and copies
+    them again if the writer lapped them in the meantime.
+    """
+    def __init__(self, size=EDGE_BUFFER_SIZE):
+        self.size = size
+        self.timestamps = [0.0] * size
+        self.count = 0  # Total number of edges pushed since creation
+
+    def push(self, timestamp):
+        self.timestamps[self.count % self.size] = timestamp
+        self.count += 1
+
+    def snapshot(self, since=0):
+        """Return (count, timestamps) of the edges numbered since..count-1, oldest first
+
+        Only the last size - 1 edges are kept: the slot after the newest edge may be
+        in the middle of being written.
+        """
+        while True:
+            count = self.count
+            first = max(since, count - self.size + 1)
+            stamps = [self.timestamps[i % self.size] for i in range(first, count)]
+            # Edge i is overwritten by edge i + size, whose push starts once count reaches i + size
+            if self.count < first + self.size:
+                return count, stamps
+
+def intervals(timestamps, n):
+    """Return up to the n most recent inter-edge intervals, oldest first"""
+    stamps = timestamps[-(n + 1):]
+    return [b - a for a, b in zip(stamps, stamps[1:])]
+
+class MagnetSpacing:
+    """Share of a revolution between each magnet and the next, learnt from the edges
+
+    The speed barely changes over one revolution, so an interval divided by the sum
+    of the last `magnets` intervals is the share of the arc it covers. Magnets are
+    told apart by edge number modulo magnets.
+    """
+    def __init__(self, magnets, rate=MAGNET_CALIBRATION_RATE):
+        self.magnets = magnets
+        self.rate = rate
+        self.shares = [1.0 / magnets] * magnets  # Arc from magnet i to magnet i + 1
+
+    def observe(self, timestamps, count):
+        """Learn from the revolution ending with the newest edge (edge number count - 1)"""
+        revolution = intervals(timestamps, self.magnets)
+        total = sum(revolution)
+        if len(revolution) < self.magnets or total <= 0:
+            return
+        share = revolution[-1] / total
+        even = 1.0 / self.magnets
+        if abs(share - even) > even * MAGNET_MAX_UNEVENNESS:
+            return  # Speeding up or slowing down, not the magnet placement
+        shares = list(self.shares)
+        arc = (count - 2) % self.magnets
+        shares[arc] += (share - shares[arc]) * self.rate
+        total_share = sum(shares)
+        self.shares = [value / total_share for value in shares]
+
+    def normalize(self, recent, count):
+        """Scale the intervals ending with edge count - 1 to evenly spaced magnets"""
+        first_arc = count - 1 - len(recent)
+        return [interval / (self.shares[(first_arc + i) % self.magnets] * self.magnets)
+                for i, interval in enumerate(recent)]
+
+class SpeedEstimator:
+    """Turns inter-edge intervals into a speed (km/h)
+
+    method is one of:
+    - "last": distance over the last interval
+    - "median": distance over the median of the last MEDIAN_INTERVALS intervals
+    - "ewma": exponentially weighted moving average of the per-interval speeds
+    """
+    METHODS = ("last", "median", "ewma")
+
+    def __init__(self, distance_m, method=SPEED_ESTIMATOR, spacing=None):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown speed estimator '{method}', expected one of {self.METHODS}")
+        self.distance_m = distance_m  # Distance travelled between two edges (on average)
+        self.method = method
+        self.spacing = spacing  # MagnetSpacing of uneven multi-magnet wheels
+        self.speed = 0.0
+
+    def reset(self):
+        self.speed = 0.0
+
+    def on_edge(self, timestamps, count):
+        """Update the estimate after a new edge, timestamps ending with it (edge number count - 1)"""
+        recent = intervals(timestamps, MEDIAN_INTERVALS if self.method == "median" else 1)
+        if not recent or recent[-1] <= 0:
+            return self.speed
+        if self.spacing:
+            self.spacing.observe(timestamps, count)
+            recent = self.spacing.normalize(recent, count)
+
+        if self.method == "last":
+            self.speed = self._to_kmh(recent[-1])
+        elif self.method == "median":
+            self.speed = self._to_kmh(median(recent))
+        else:
+            instant = self._to_kmh(recent[-1])
+            if self.speed == 0:
+                self.speed = instant
+            else:
+                self.speed += (instant - self.speed) * EWMA_ALPHA
+        return self.speed
+
+    def decay(self, timestamps, current_time):
+        """Lower the estimate when the next edge is late
+
+        While waiting for an edge, the wheel can't be faster than one edge
+        distance over the time elapsed since the last edge. After
+        EDGE_TIMEOUT seconds without an edge the speed drops to 0.
+        """
+        if not timestamps:
+            self.speed = 0.0
+            return self.speed
+
+        elapsed = current_time - timestamps[-1]
+        if elapsed >= EDGE_TIMEOUT:
+            self.speed = 0.0
+        elif elapsed > 0:
+            self.speed = min(self.speed, self._to_kmh(elapsed))
+        return self.speed
+
+    def _to_kmh(self, interval):
+        return self.distance_m / interval * 3.6
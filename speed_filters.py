@@ -0,0 +1,125 @@
+# Streaming filters for the speed signal
+#
+# Each filter takes one sample at a time with update(value, timestamp) and keeps a
+# fixed-size state allocated once, so the cost per sample doesn't grow with the
+# window and no array is created on the hot path.
+
+from bisect import bisect_left, insort
+
+# Constants
+from config import *
+
+class MovingAverage:
+    """Average of the last size samples, from a running sum"""
+    def __init__(self, size=AVG_SMOOTHNESS):
+        self.size = size
+        self.samples = [0.0] * size
+        self.reset()
+
+    def reset(self):
+        for i in range(self.size):
+            self.samples[i] = 0.0
+        self.index = 0
+        self.total = 0.0
+        self.value = 0.0
+
+    def update(self, value, timestamp=None):
+        self.total += value - self.samples[self.index]
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.size
+        if self.index == 0:
+            # Once per window, drop the rounding errors accumulated by the running sum
+            self.total = sum(self.samples)
+        self.value = self.total / self.size
+        return self.value
+
+class Ewma:
+    """Exponentially weighted moving average"""
+    def __init__(self, alpha=FILTER_EWMA_ALPHA):
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.value = None
+
+    def update(self, value, timestamp=None):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += (value - self.value) * self.alpha
+        return self.value
+
+class MedianFilter:
+    """Median of the last size samples
+
+    The samples are kept twice: in arrival order, to know which one leaves the
+    window, and sorted, to read the median.
+    """
+    def __init__(self, size=AVG_SMOOTHNESS):
+        self.size = size
+        self.samples = [0.0] * size
+        self.reset()
+
+    def reset(self):
+        for i in range(self.size):
+            self.samples[i] = 0.0
+        self.sorted = [0.0] * self.size
+        self.index = 0
+        self.value = 0.0
+
+    def update(self, value, timestamp=None):
+        del self.sorted[bisect_left(self.sorted, self.samples[self.index])]
+        insort(self.sorted, value)
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.size
+        middle = self.size // 2
+        if self.size % 2:
+            self.value = self.sorted[middle]
+        else:
+            self.value = (self.sorted[middle - 1] + self.sorted[middle]) / 2
+        return self.value
+
+class AlphaBeta:
+    """Alpha-beta tracker of the speed and its rate of change
+
+    Predicts the speed from the last estimate and acceleration, then corrects both
+    by a fixed share (alpha, beta) of the prediction error. acceleration is in km/h
+    per second.
+    """
+    def __init__(self, alpha=ALPHA_BETA_ALPHA, beta=ALPHA_BETA_BETA):
+        self.alpha = alpha
+        self.beta = beta
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.acceleration = 0.0
+        self.last_time = None
+
+    def update(self, value, timestamp):
+        if self.value is None:
+            self.value = value
+            self.last_time = timestamp
+            return self.value
+        dt = timestamp - self.last_time
+        if dt <= 0:
+            return self.value
+        self.last_time = timestamp
+        predicted = self.value + self.acceleration * dt
+        error = value - predicted
+        self.value = predicted + self.alpha * error
+        self.acceleration += self.beta * error / dt
+        return self.value
+
+FILTERS = {
+    "average": MovingAverage,
+    "ewma": Ewma,
+    "median": MedianFilter,
+    "alpha_beta": AlphaBeta,
+}
+
+def make_filter(name=SPEED_FILTER):
+    """Create the speed filter called name (one of FILTERS)"""
+    if name not in FILTERS:
+        raise ValueError(f"Unknown speed filter '{name}', expected one of {tuple(FILTERS)}")
+    return FILTERS[name]()
@@ -0,0 +1,53 @@
+# Speed forecast, so the sound changes start when the rider crosses a threshold
+# instead of after the fades caught up with the measured speed
+
+from speed_filters import AlphaBeta
+
+# Constants
+from config import *
+
+class SpeedPredictor:
+    """Extrapolates the wheel speed PREDICTION_HORIZON seconds ahead
+
+    The acceleration comes from an alpha-beta tracker fed with every new speed the
+    wheel publishes.
+    """
+    def __init__(self, horizon=PREDICTION_HORIZON):
+        self.horizon = horizon
+        self.tracker = AlphaBeta()
+        self.last_sample = None
+        self.forecast = 0.0
+
+    def reset(self):
+        self.tracker.reset()
+        self.last_sample = None
+        self.forecast = 0.0
+
+    def update(self, wheel, current_time):
+        """Forecast from a WheelState (see wheel_meter.py)"""
+        if not wheel.moving:
+            self.reset()
+            return self.forecast
+        sample = (wheel.count, wheel.speed)
+        if sample != self.last_sample:
+            self.last_sample = sample
+            self.tracker.update(wheel.speed, current_time)
+        self.forecast = max(0.0, wheel.speed + self.tracker.acceleration * self.horizon)
+        return self.forecast
+
+class Hysteresis:
+    """Speed band (0 below thresholds[0], 1 up to thresholds[1], ...) that only changes
+    once the speed is margin past a threshold, so it doesn't flap around it"""
+    def __init__(self, thresholds, margin=SPEED_HYSTERESIS):
+        self.thresholds = thresholds
+        self.margin = margin
+        self.band = None
+
+    def update(self, speed):
+        if self.band is None:
+            self.band = sum(speed > threshold for threshold in self.thresholds)
+        while self.band < len(self.thresholds) and speed > self.thresholds[self.band] + self.margin:
+            self.band += 1
+        while self.band > 0 and speed <= self.thresholds[self.band - 1] - self.margin:
+            self.band -= 1
+        return self.band
@@ -0,0 +1,96 @@
+# Persistent store for the runtime settings and state (master volume, milestones, trip)
+#
+# set() only changes the values in memory; a background thread writes them to
+# STATE_FILE STATE_SAVE_DELAY seconds after the first change, so a burst of changes
+# (or periodic snapshots) costs one write per STATE_SAVE_DELAY at most. The file is
+# replaced atomically (temporary file, fsync, rename), so a power loss leaves either
+# the old or the new state.
+
+import atexit
+import json
+import os
+from threading import Thread, Lock, Event
+import clock
+from config import *
+
+class StateStore:
+    def __init__(self, path=STATE_FILE, delay=STATE_SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.lock = Lock()
+        self.write_lock = Lock()
+        self.changed = Event()
+        self.dirty = False
+        self.thread = None
+        self.values = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Error loading state from {self.path}, starting fresh: {e}")
+            return {}
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+        """Change several values at once, to be saved in the same write"""
+        with self.lock:
+            values = {key: value for key, value in values.items() if key not in self.values or self.values[key] != value}
+            if not values:
+                return
+            self.values.update(values)
+            self.dirty = True
+            if self.thread is None:
+                self.thread = Thread(target=self._save_loop, daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+        self.changed.set()
+        clock.notify()
+
+    def _save_loop(self):
+        while True:
+            clock.wait(self.changed)
+            self.changed.clear()
+            # Let the changes of the next STATE_SAVE_DELAY seconds join this write
+            clock.sleep(self.delay)
+            self.flush()
+
+    def flush(self):
+        """Write the values now if they changed since the last write"""
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = json.dumps(self.values, indent=2)
+                self.dirty = False
+            try:
+                self._write(data)
+            except OSError as e:
+                print(f"Error saving state to {self.path}: {e}")
+                with self.lock:
+                    self.dirty = True
+
+    def _write(self, data):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        # Make the rename itself durable
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+state = StateStore()
@@ -0,0 +1,7 @@
+# The tests run on the simulated pins and without an audio device
+import os
+import sys
+
+os.environ.setdefault("LEGIBLE_GPIO", "sim")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
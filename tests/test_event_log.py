@@ -0,0 +1,22 @@
+import clock
+from event_log import EventLog, DEBUG, INFO
+
+def test_due_follows_the_level_and_the_rate_limit():
+    virtual_clock = clock.VirtualClock()
+    previous = clock.get_clock()
+    clock.set_clock(virtual_clock)
+    try:
+        log = EventLog()
+        log.rate_limits = {"sound.status": 0.5}
+        log.set_level("sound", DEBUG)
+        assert log.due("sound", "status", "s1")
+        log.debug("sound", "status", name="s1")
+        assert not log.due("sound", "status", "s1")
+        assert log.due("sound", "status", "s2")  # Limited per name
+        assert log.due("sound", "other")  # Not rate-limited
+        virtual_clock.advance(0.5)
+        assert log.due("sound", "status", "s1")
+        log.set_level("sound", INFO)
+        assert not log.due("sound", "status", "s1")
+    finally:
+        clock.set_clock(previous)
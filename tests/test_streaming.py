@@ -0,0 +1,61 @@
+import array
+import math
+import time
+import wave
+
+import pygame
+import pytest
+
+import pcm_cache
+import sound_behavior
+from sound_behavior import StreamingTrack
+
+FREQUENCY = 44100
+
+@pytest.fixture
+def mixer():
+    pygame.mixer.init(FREQUENCY, -16, 2)
+    yield
+    pygame.mixer.quit()
+
+@pytest.fixture
+def tone(tmp_path, monkeypatch):
+    """A 0.42 s tone, streamed in 0.2 s chunks: the track is not a whole number of chunks"""
+    monkeypatch.setattr(pcm_cache, "cache_dir", lambda: str(tmp_path / "cache"))
+    monkeypatch.setattr(sound_behavior, "STREAM_CHUNK_SECONDS", 0.2)
+    samples = array.array("h")
+    for i in range(int(FREQUENCY * 0.42)):
+        value = int(8000 * math.sin(2 * math.pi * 440 * i / FREQUENCY))
+        samples.extend((value, value))
+    path = tmp_path / "tone.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(FREQUENCY)
+        f.writeframes(samples.tobytes())
+    return str(path)
+
+def test_chunks_wrap_around_whole(mixer, tone):
+    track = StreamingTrack(tone)
+    with open(track.path, "rb") as f:
+        data = f.read()[:track.length]
+    chunks = [track._next_chunk().get_raw() for _ in range(5)]
+    assert all(len(chunk) == track.chunk_size for chunk in chunks)
+    # The chunks follow each other through the loop points without a gap
+    played = b"".join(chunks)
+    assert played == (data * 3)[:len(played)]
+    track.close()
+
+def test_keeps_playing_with_late_feeds(mixer, tone):
+    track = StreamingTrack(tone)
+    channel = pygame.mixer.Channel(0)
+    track.start(channel)
+    # Feeds further apart than a chunk, so both chunks sometimes run out in between
+    start = time.monotonic()
+    while time.monotonic() - start < 2:
+        time.sleep(0.5)
+        track.feed()
+        assert channel.get_busy()
+        assert channel.get_queue() is not None
+    track.close()
+    channel.stop()
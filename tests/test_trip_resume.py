@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from trip_timeline import Trip, Frame, SpeedGain, SpeedBands, TripTimeline, SNAPSHOT_KEYS
+from config import RESUME_MAX_AGE
+
+class FakeSoundManager:
+    """Records the tracks the timeline asks for"""
+    def __init__(self):
+        self.used = None
+
+    def use(self, *names):
+        self.used = names
+
+    def prefetch(self, *names):
+        pass
+
+    def mute_all(self):
+        pass
+
+    def restart(self, *names):
+        pass
+
+    def set_gains(self, gains):
+        pass
+
+    def is_fading(self):
+        return False
+
+TRIP = Trip("test", [
+    Frame("First", ("a",), SpeedGain(), ride_time=30),
+    Frame("Second", ("b", "c"), SpeedBands((10,), [{"b": 1.0}, {"c": 1.0}], fade_rate=0.5)),
+])
+
+def snapshot(**changes):
+    saved = {"trip": "test", "elapsed": 50.0, "frame": 1, "ride_time": 12.0, "stopped_for": None,
+             "rule": {"current": {"b": 0.5, "c": 0.0}, "targets": {"b": 1.0, "c": 0.0}},
+             "saved_at": time.time()}
+    saved.update(changes)
+    return saved
+
+def test_resumes_a_recent_snapshot():
+    timeline = TripTimeline(TRIP, FakeSoundManager())
+    assert timeline.resume(snapshot(), 100.0)
+    assert timeline.frame_index == 1
+    assert timeline.start_time == 50.0
+    assert timeline.ride_time == 12.0
+    assert timeline.sound_manager.used == ("b", "c")
+    # Round trip
+    assert {key: value for key, value in timeline.snapshot(100.0).items() if key != "saved_at"} == \
+           {key: value for key, value in snapshot().items() if key != "saved_at"}
+
+@pytest.mark.parametrize("saved", [
+    None,
+    "not a snapshot",
+    snapshot(trip="other"),
+    snapshot(saved_at=time.time() - RESUME_MAX_AGE - 1),
+    snapshot(frame=2),  # The trip lost frames since
+    snapshot(frame=-1),
+    snapshot(frame="1"),
+    snapshot(elapsed="fifty"),
+    snapshot(ride_time=None),
+    snapshot(rule={"current": {"b": 0.5}, "targets": {}}),
+] + [{key: value for key, value in snapshot().items() if key != missing} for missing in SNAPSHOT_KEYS])
+def test_starts_over_from_a_bad_snapshot(saved):
+    timeline = TripTimeline(TRIP, FakeSoundManager())
+    assert not timeline.resume(saved, 100.0)
+    assert timeline.start_time is None
+    assert timeline.frame_index == 0
+    assert timeline.ride_time == 0
+    assert timeline.stop_counter is None
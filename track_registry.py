@@ -0,0 +1,83 @@
+# Registry of the available tracks and of the memory the loaded ones take
+#
+# The tracks are the audio files of the tracks folder, named after the file without
+# its extension ("s1" for s1.mp3), or the entries of its manifest (TRACK_MANIFEST, a
+# JSON object of name -> file name) when there is one.
+
+import json
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+from config import *
+
+AUDIO_EXTENSIONS = (".mp3", ".ogg", ".wav")
+
+def _natural_key(name):
+    # "s2" before "s10"
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+class TrackRegistry:
+    def __init__(self, tracks_path, budget_mb=TRACK_MEMORY_BUDGET_MB):
+        self.tracks_path = tracks_path
+        self.paths = self._discover()
+        self.budget = budget_mb * 1024 * 1024
+        self.loaded = OrderedDict()  # Name -> bytes in memory, least recently used first
+        self.lock = Lock()
+
+    def _discover(self):
+        manifest = os.path.join(self.tracks_path, TRACK_MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                entries = json.load(f)
+            return {name: os.path.join(self.tracks_path, file_name) for name, file_name in entries.items()}
+        try:
+            files = os.listdir(self.tracks_path)
+        except FileNotFoundError:
+            return {}
+        paths = {}
+        for file_name in files:
+            name, extension = os.path.splitext(file_name)
+            if extension.lower() in AUDIO_EXTENSIONS:
+                paths[name] = os.path.join(self.tracks_path, file_name)
+        return paths
+
+    @property
+    def names(self):
+        return sorted(self.paths, key=_natural_key)
+
+    def path(self, name):
+        return self.paths[name]
+
+    def used(self, *names):
+        """Mark loaded tracks as recently used"""
+        with self.lock:
+            for name in names:
+                if name in self.loaded:
+                    self.loaded.move_to_end(name)
+
+    def add(self, name, size):
+        with self.lock:
+            self.loaded[name] = size
+            self.loaded.move_to_end(name)
+
+    def remove(self, name):
+        with self.lock:
+            self.loaded.pop(name, None)
+
+    @property
+    def memory(self):
+        return sum(self.loaded.values())
+
+    def to_evict(self, keep):
+        """Least recently used tracks to unload, not in keep, to get back under the budget"""
+        with self.lock:
+            excess = sum(self.loaded.values()) - self.budget
+            evict = []
+            for name, size in self.loaded.items():
+                if excess <= 0:
+                    break
+                if name not in keep:
+                    evict.append(name)
+                    excess -= size
+            return evict
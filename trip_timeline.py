@@ -0,0 +1,278 @@
+# Trips as data
+#
+# A Trip is a timeline of Frames. Each frame names the tracks it plays, a rule turning
+# the speed into their volumes, when it ends and what happens when the bike stops.
+# TripTimeline runs one trip as a state machine: it only evaluates the active frame
+# and knows from it when it must be evaluated next. See legible.py for the trips.
+
+import time
+from speed_predictor import Hysteresis
+from config import *
+from event_log import log
+
+DEADLINE_MARGIN = 0.001  # Evaluate just after a frame boundary so the comparisons see it crossed
+SNAPSHOT_KEYS = ("trip", "elapsed", "frame", "ride_time", "stopped_for", "rule", "saved_at")
+
+class SpeedGain:
+    """The same volume for all tracks: base + per_kmh * speed, kept within [low, high]
+
+    starts staggers the tracks: a track listed there only plays once the bike rode
+    that many seconds in the frame.
+    """
+    def __init__(self, base=0, per_kmh=10, low=0, high=100, starts=None):
+        self.base = base
+        self.per_kmh = per_kmh
+        self.low = low
+        self.high = high
+        self.starts = starts or {}
+        self.changes = sorted(set(self.starts.values()))
+        self.changed = False
+
+    def reset(self):
+        pass
+
+    def gains(self, tracks, speed, moving, ride_time, dt):
+        """Volume (0-100) of the tracks that play now (dt: seconds since the last evaluation)"""
+        volume = max(self.low, min(self.high, self.base + self.per_kmh * speed))
+        return {track: volume for track in tracks if track not in self.starts or ride_time > self.starts[track]}
+
+    def fading(self):
+        return False
+
+    def snapshot(self):
+        return None
+
+    def restore(self, saved):
+        pass
+
+class SpeedBands:
+    """One volume (0-1) per track for each speed band: below thresholds[0], up to thresholds[1], ...
+
+    The volumes move by fade_rate per second towards the ones of the band, or
+    towards 0 while the bike is stopped. With hysteresis, the band only changes once
+    the speed is SPEED_HYSTERESIS past a threshold.
+    """
+    def __init__(self, thresholds, bands, fade_rate=0.0, hysteresis=False):
+        self.thresholds = thresholds
+        self.bands = bands
+        self.fade_rate = fade_rate
+        self.hysteresis = Hysteresis(thresholds) if hysteresis else None
+        self.changes = []
+        self.band = None
+        self.changed = False  # Whether the last evaluation changed band
+        self.tracks = sorted({track for band in bands for track in band})
+        self.reset()
+
+    def reset(self):
+        self.current = {track: 0.0 for track in self.tracks}
+        self.targets = {track: 0.0 for track in self.tracks}
+
+    def gains(self, tracks, speed, moving, ride_time, dt):
+        self.changed = False
+        if moving:
+            if self.hysteresis:
+                band = self.hysteresis.update(speed)
+            else:
+                band = sum(speed > threshold for threshold in self.thresholds)
+            self.changed = self.band is not None and band != self.band
+            self.band = band
+            for track in self.tracks:
+                self.targets[track] = self.bands[band].get(track, 0.0)
+        else:
+            for track in self.tracks:
+                self.targets[track] = 0.0
+
+        step = self.fade_rate * dt
+        for track, target in self.targets.items():
+            if self.current[track] < target:
+                self.current[track] = min(target, self.current[track] + step)
+            elif self.current[track] > target:
+                self.current[track] = max(target, self.current[track] - step)
+        return {track: volume * 100 for track, volume in self.current.items()}
+
+    def fading(self):
+        return self.fade_rate > 0 and self.current != self.targets
+
+    def snapshot(self):
+        return {"current": dict(self.current), "targets": dict(self.targets)}
+
+    def restore(self, saved):
+        # Every track of the bands, or the snapshot is of another version of the trip
+        self.current = {track: float(saved["current"][track]) for track in self.tracks}
+        self.targets = {track: float(saved["targets"][track]) for track in self.tracks}
+
+class Frame:
+    """A part of a trip
+
+    It ends once the bike rode ride_time seconds in it, or once until seconds passed
+    since the trip started (None: it never ends). While the bike is stopped, the
+    tracks are muted (mute_when_stopped) or left to the rule, and the trip starts
+    over after stop_timeout seconds (None: never).
+    """
+    def __init__(self, name, tracks, rule, ride_time=None, until=None, stop_timeout=None, mute_when_stopped=True):
+        self.name = name
+        self.tracks = tuple(tracks)
+        self.rule = rule
+        self.ride_time = ride_time
+        self.until = until
+        self.stop_timeout = stop_timeout
+        self.mute_when_stopped = mute_when_stopped
+        # Ride times at which the frame must be evaluated again
+        self.changes = [change for change in rule.changes if ride_time is None or change < ride_time]
+        if ride_time is not None:
+            self.changes.append(ride_time)
+
+    def over(self, elapsed, ride_time):
+        return ((self.ride_time is not None and ride_time > self.ride_time)
+                or (self.until is not None and elapsed > self.until))
+
+class Trip:
+    """A named timeline of frames, played in order until the last one ends"""
+    def __init__(self, name, frames):
+        self.name = name
+        self.frames = tuple(frames)
+
+class TripTimeline:
+    """Runs a trip on the sound manager, from the speed and movement of the bike"""
+    def __init__(self, trip, sound_manager, on_sound_change=None):
+        self.trip = trip
+        self.sound_manager = sound_manager
+        self.on_sound_change = on_sound_change  # Called when a rule changes band
+        self.start_time = None
+        self.frame_index = 0
+        self.ride_time = 0  # Seconds ridden in the current frame
+        self.stop_counter = None
+        self.moving = False  # At the previous evaluation
+
+    @property
+    def frame(self):
+        return self.trip.frames[self.frame_index]
+
+    def load_tracks(self):
+        """Load the tracks of the current frame, and the next frame's in the background"""
+        frames = self.trip.frames
+        self.sound_manager.use(*frames[self.frame_index].tracks)
+        # After the last frame the trip starts over
+        self.sound_manager.prefetch(*frames[(self.frame_index + 1) % len(frames)].tracks)
+
+    def reset(self):
+        self.sound_manager.mute_all()
+        self.start_time = None
+        self.stop_counter = None
+        self._enter(0)
+
+    def _enter(self, index):
+        self.frame_index = index
+        self.ride_time = 0
+        self.frame.rule.reset()
+        self.load_tracks()
+
+    def _start_frame(self, index):
+        self._enter(index)
+        log.info("trip", "frame_change", frame=index + 1, name=self.frame.name)
+        self.sound_manager.mute_all()
+        self.sound_manager.restart(*self.frame.tracks)
+
+    def update(self, current_time, speed, moving, master_volume, dt):
+        """Evaluate the active frame once"""
+        was_moving, self.moving = self.moving, moving
+        if self.start_time is None:
+            if not moving:
+                return
+            self.start_time = current_time
+            log.info("trip", "trip_start", trip=self.trip.name)
+            self._start_frame(0)
+
+        frame = self.frame
+        if moving:
+            self.stop_counter = None
+            # Only the time between two evaluations that both saw the bike moving was ridden
+            if was_moving:
+                self.ride_time += dt
+        elif frame.stop_timeout is not None:
+            if self.stop_counter is None:
+                self.stop_counter = current_time
+                log.info("trip", "stop_countdown", timeout=frame.stop_timeout)
+            elif current_time - self.stop_counter >= frame.stop_timeout:
+                log.info("trip", "stop_reset", timeout=frame.stop_timeout)
+                self.reset()
+                return
+
+        if frame.over(current_time - self.start_time, self.ride_time):
+            if self.frame_index + 1 == len(self.trip.frames):
+                log.info("trip", "sequence_complete", trip=self.trip.name)
+                self.reset()
+                return
+            self._start_frame(self.frame_index + 1)
+            frame = self.frame
+
+        if not moving and frame.mute_when_stopped:
+            self.sound_manager.mute_all()
+            return
+        gains = frame.rule.gains(frame.tracks, speed, moving, self.ride_time, dt)
+        if frame.rule.changed and self.on_sound_change:
+            self.on_sound_change()
+        self.sound_manager.set_gains({track: volume * master_volume for track, volume in gains.items()})
+        log.debug("trip", "playing", frame=self.frame_index + 1, **gains)
+
+    def next_deadline(self, current_time, moving):
+        """Time at which the trip must be evaluated again without any new input (None: wait for inputs)"""
+        deadlines = []
+
+        # Fades progress one step per FADE_INTERVAL until every volume reached its target
+        if self.sound_manager.is_fading() or self.frame.rule.fading():
+            deadlines.append(current_time + FADE_INTERVAL)
+
+        if self.start_time is not None:
+            frame = self.frame
+            if self.stop_counter is not None and frame.stop_timeout is not None:
+                deadlines.append(self.stop_counter + frame.stop_timeout)
+            if frame.until is not None:
+                deadlines.append(self.start_time + frame.until + DEADLINE_MARGIN)
+            # Ride time only advances while moving
+            if moving:
+                change = next((change for change in frame.changes if change >= self.ride_time), None)
+                if change is not None:
+                    deadlines.append(current_time + change - self.ride_time + DEADLINE_MARGIN)
+
+        return min(deadlines) if deadlines else None
+
+    def snapshot(self, current_time):
+        """State to resume the trip from after a restart (None when no trip is running)"""
+        if self.start_time is None:
+            return None
+        return {
+            "trip": self.trip.name,
+            "elapsed": current_time - self.start_time,
+            "frame": self.frame_index,
+            "ride_time": self.ride_time,
+            "stopped_for": current_time - self.stop_counter if self.stop_counter is not None else None,
+            "rule": self.frame.rule.snapshot(),
+            "saved_at": time.time(),  # Wall clock, the monotonic clock restarts with the program
+        }
+
+    def resume(self, saved, current_time):
+        """Continue a trip from a snapshot, return whether it was recent enough to"""
+        if (not isinstance(saved, dict) or saved.get("trip") != self.trip.name
+                or any(key not in saved for key in SNAPSHOT_KEYS)):
+            return False
+        try:
+            if time.time() - saved["saved_at"] > RESUME_MAX_AGE:
+                return False
+            # A trip edited since the snapshot can have fewer frames
+            if not 0 <= saved["frame"] < len(self.trip.frames):
+                raise IndexError(f"no frame {saved['frame']}")
+            # The time the program was down doesn't count
+            self.start_time = current_time - float(saved["elapsed"])
+            self._enter(saved["frame"])
+            self.ride_time = float(saved["ride_time"])
+            if saved["stopped_for"] is not None:
+                self.stop_counter = current_time - float(saved["stopped_for"])
+            if saved["rule"] is not None:
+                self.frame.rule.restore(saved["rule"])
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            log.info("trip", "resume_failed", trip=self.trip.name, error=e)
+            self.reset()
+            return False
+        log.info("trip", "resumed", trip=self.trip.name, elapsed=saved["elapsed"], frame=self.frame_index + 1)
+        return True
@@ -1,173 +1,420 @@
 # Imports
-from gpiozero import Button
+from gpio_backend import Button, is_simulated
 from signal import pause
-from time import time, sleep
-from threading import Thread
+from clock import now, sleep
+from scheduler import scheduler
 from math import pi
 from colorama import Fore, Back, Style
-import numpy as np
 from datetime import datetime
-from hardware_controls import VolumeEncoder
+import time
+from hardware_controls import VolumeEncoder, RGBLed
+from speed_estimator import EdgeBuffer, MagnetSpacing, SpeedEstimator
+from speed_filters import make_filter
+from state_store import state
+from event_log import log
 import atexit
+from collections import namedtuple
 
 # Constants
 from config import *
 
+class PedalState(namedtuple("PedalState", "count moving direction cadence speed start_time stop_time")):
+    """Consistent view of the pedals, published at once by their meter
+
+    count: edges of both sensors since the start
+    cadence: pedal revolutions per minute
+    speed: speed of the pedal magnet along its circle (km/h)
+    """
+
 class PedalWheel:
+    """Pedal movement, direction and cadence from the two pedal sensors
+
+    Like MainWheel, the sensor callbacks only push timestamps into one ring buffer per
+    sensor. The meter derives the cadence from full revolutions (two edges of the same
+    sensor) and, until one was timed, from the time the magnet takes from one sensor
+    to the other (PEDAL_SENSOR_DISTANCE apart).
+    """
     def __init__(self, pin1, pin2, bounce_time=BOUNCE_TIME):
         self.sensor1 = Button(pin1, bounce_time=bounce_time)
         self.sensor2 = Button(pin2, bounce_time=bounce_time)
-        self.last_sensor1_time = 0
-        self.last_sensor2_time = 0
-        self.direction = 0  # 1 for forward, -1 for backward
-        self.is_moving = False
-        self.speed = 0
-        self.start_time = 0
-        self.stop_time = 0
+        self.circum_m = 2 * pi * PEDAL_RADIUS
+        self.edges = (EdgeBuffer(), EdgeBuffer())  # Sensor 1, sensor 2
+        self.estimators = (SpeedEstimator(self.circum_m, CADENCE_ESTIMATOR), SpeedEstimator(self.circum_m, CADENCE_ESTIMATOR))
+        self.ride_start = [0, 0]  # Number of the first edge of each sensor since the last stop
+        self.processed = [0, 0]
+        self.pending = False  # A handoff to the meter is queued
+        self.state = PedalState(0, False, 0, 0, 0, 0, 0)
         
         self.sensor1.when_pressed = self.sensor1_detected
         self.sensor2.when_pressed = self.sensor2_detected
         
-        # Start monitoring thread
-        self.monitor_thread = Thread(target=self.check_movement, daemon=True)
-        self.monitor_thread.start()
+        # Periodic checks run on the shared scheduler
+        self.monitor_task = scheduler.every(MOVEMENT_CHECK_RATE, self.check_movement)
         
         atexit.register(self.cleanup)  # Register cleanup function
         
-        if DEBUG_MODE:
-            self.debug_thread = Thread(target=self.debug_output, daemon=True)
-            self.debug_thread.start()
+        if log.enabled("pedal_wheel"):
+            self.debug_task = scheduler.every(DEBUG_REFRESH_RATE, self.debug_output)
     
     def cleanup(self):
         """Clean up GPIO resources"""
         self.sensor1.close()
         self.sensor2.close()
     
+    def snapshot(self):
+        """Latest PedalState"""
+        return self.state
+    
+    @property
+    def is_moving(self):
+        return self.state.moving
+    
+    @property
+    def direction(self):
+        return self.state.direction  # 1 for forward, -1 for backward
+    
+    @property
+    def cadence(self):
+        return self.state.cadence
+    
+    @property
+    def speed(self):
+        return self.state.speed
+    
+    @property
+    def start_time(self):
+        return self.state.start_time
+    
+    @property
+    def stop_time(self):
+        return self.state.stop_time
+    
     def sensor1_detected(self):
-        current_time = time()
-        if self.last_sensor2_time > self.last_sensor1_time:
-            self.direction = 1  # Forward
-        self.last_sensor1_time = current_time
-        self.is_moving = True
-        if not self.start_time:
-            self.start_time = current_time
+        self.edges[0].push(now())
+        self._hand_off()
     
     def sensor2_detected(self):
-        current_time = time()
-        if self.last_sensor1_time > self.last_sensor2_time:
-            self.direction = -1  # Backward
-        self.last_sensor2_time = current_time
-        self.is_moving = True
-        if not self.start_time:
-            self.start_time = current_time
+        self.edges[1].push(now())
+        self._hand_off()
+    
+    def _hand_off(self):
+        # One meter task per burst of edges: the flag is only cleared by the meter
+        if not self.pending:
+            self.pending = True
+            scheduler.after(0, self._take_pending, name="pedal_edge")
+    
+    def _take_pending(self):
+        # Cleared first, so an edge pushed from now on queues another handoff
+        self.pending = False
+        self.take_edges()
+    
+    def _snapshots(self):
+        """Timestamps of each sensor since the ride start, without the edges not taken in yet"""
+        snapshots = []
+        for sensor in (0, 1):
+            count, stamps = self.edges[sensor].snapshot(self.ride_start[sensor])
+            snapshots.append(stamps[:len(stamps) - (count - self.processed[sensor])])
+        return snapshots
+    
+    def take_edges(self):
+        """Take in the edges pushed since the last call"""
+        for sensor in (0, 1):
+            count, stamps = self.edges[sensor].snapshot(self.ride_start[sensor])
+            new = count - self.processed[sensor]
+            self.processed[sensor] = count
+            for end in range(max(len(stamps) - new + 1, 1), len(stamps) + 1):
+                self.estimators[sensor].on_edge(stamps[:end], count - len(stamps) + end)
+        state = self.state
+        if sum(self.processed) == state.count:
+            return
+        
+        stamps = self._snapshots()
+        direction, speed, revolution = self._measure(stamps)
+        start_time = state.start_time if state.moving else min(sensor[0] for sensor in stamps if sensor)
+        self._publish(sum(self.processed), True, direction, speed, start_time, state.stop_time)
+    
+    def _measure(self, stamps, current_time=None):
+        """Direction, pedal speed and last revolution time from the edges of the ride
+        
+        With current_time, the speed is lowered as for a late edge.
+        """
+        # The sensor of the most recent edge ([] sorts before any timestamp)
+        latest = 0 if stamps[0][-1:] >= stamps[1][-1:] else 1
+        revolution = stamps[latest][-1] - stamps[latest][-2] if len(stamps[latest]) > 1 else None
+        
+        # Riding forward the magnet passes sensor 2 then sensor 1, close to each other
+        direction = self.state.direction
+        transit = None
+        if stamps[0] and stamps[1]:
+            gap = stamps[0][-1] - stamps[1][-1]
+            if revolution and abs(gap) > revolution / 2:
+                gap = -gap  # The long way round, the short gap is the other way
+            direction = 1 if gap > 0 else -1
+            transit = abs(gap)
+        
+        if revolution:
+            estimator = self.estimators[latest]
+            speed = estimator.speed if current_time is None else estimator.decay(stamps[latest], current_time)
+        else:
+            # No full revolution yet: time the magnet between the two sensors
+            speed = PEDAL_SENSOR_DISTANCE / transit * 3.6 if transit else 0.0
+        return direction, speed, revolution
     
     def check_movement(self):
-        while True:
-            current_time = time()
-            if (current_time - max(self.last_sensor1_time, self.last_sensor2_time) > MOVEMENT_TIMEOUT 
-                and self.is_moving):
-                self.is_moving = False
-                self.stop_time = current_time
-                self.speed = 0
-            sleep(0.1)
+        self.take_edges()
+        state = self.state
+        if not state.moving:
+            return
+        current_time = now()
+        stamps = self._snapshots()
+        direction, speed, revolution = self._measure(stamps, current_time)
+        
+        # Stopped once the next revolution is overdue (MOVEMENT_TIMEOUT before one was timed)
+        timeout = STOP_OVERDUE_FACTOR * revolution if revolution else MOVEMENT_TIMEOUT
+        if current_time - max(sensor[-1] for sensor in stamps if sensor) > timeout:
+            self.ride_start = list(self.processed)
+            for estimator in self.estimators:
+                estimator.reset()
+            self._publish(state.count, False, direction, 0, state.start_time, current_time)
+        elif speed != state.speed:
+            self._publish(state.count, True, direction, speed, state.start_time, state.stop_time)
+    
+    def _publish(self, count, moving, direction, speed, start_time, stop_time):
+        cadence = speed / 3.6 / self.circum_m * 60
+        self.state = PedalState(count, moving, direction, cadence, speed, start_time, stop_time)
 
     def debug_output(self):
-        while True:
-            if DEBUG_MODE and DEBUG_PEDAL_WHEEL:
-                current_time = time()
-                print("\n=== Pedal Wheel Debug ===")
-                print(f"Moving: {self.is_moving}")
-                print(f"Direction: {'Forward' if self.direction == 1 else 'Backward' if self.direction == -1 else 'None'}")
-                print(f"Time since Sensor 1: {current_time - self.last_sensor1_time:.2f}s")
-                print(f"Time since Sensor 2: {current_time - self.last_sensor2_time:.2f}s")
-                if self.is_moving:
-                    print(f"Active time: {current_time - self.start_time:.1f}s")
-                if self.stop_time:
-                    print(f"Last stop: {current_time - self.stop_time:.1f}s ago")
-            sleep(DEBUG_REFRESH_RATE)
+        # Through the event log: printing here would hold up the meter on the scheduler thread
+        state = self.snapshot()
+        current_time = now()
+        log.debug("pedal_wheel", "status", moving=state.moving,
+                  direction={1: "forward", -1: "backward"}.get(state.direction),
+                  cadence=state.cadence, speed=state.speed,
+                  active_time=current_time - state.start_time if state.moving else None,
+                  since_stop=current_time - state.stop_time if state.stop_time else None)
+
+class WheelState(namedtuple("WheelState", "count timestamps moving speed avg_speed acceleration start_time stop_time")):
+    """Consistent view of a wheel, published at once by its meter
+
+    count: edges since the start (never reset, so differences never lose an edge)
+    timestamps: the latest edge times of the current ride, oldest first
+    avg_speed, acceleration: output of the SPEED_FILTER (acceleration in km/h per
+    second, only estimated by the "alpha_beta" filter)
+    """
 
 class MainWheel:
-    def __init__(self, pin, wheel_diameter_mm=DEFAULT_DIAMETER):
+    """Main wheel speed from the Hall sensor
+
+    The sensor callback only pushes edge timestamps into a single-writer ring buffer
+    and hands off to the meter, one task per burst of edges (a flag set by the
+    callback, cleared by the meter). The meter, on the shared scheduler, is the only
+    one to derive the speed and movement from it; it publishes them as one WheelState
+    that readers get with snapshot(), without any lock on the sensor path.
+    """
+    def __init__(self, pin, wheel_diameter_mm=DEFAULT_DIAMETER, magnets=WHEEL_MAGNETS, pedal=None):
         self.sensor = Button(pin, bounce_time=BOUNCE_TIME)
+        self.pedal = pedal  # PedalWheel whose stops make the wheel stop detection quicker
         self.wheel_diameter_mm = wheel_diameter_mm
         self.circum_m = wheel_diameter_mm * pi / 1000
-        self.count = 0
-        self.previous_time = time()
-        self.previous_values = np.zeros(AVG_SMOOTHNESS)
-        self.speed = 0
-        self.avg_speed = 0
-        self.is_moving = False
-        self.start_time = 0
-        self.stop_time = 0
+        self.magnets = magnets
+        self.edge_distance_m = self.circum_m / magnets  # Each magnet adds an edge, so speed updates that much more often
+        self.count = 0  # Edges of the current PERIOD ("window" estimator)
+        self.previous_time = now()
+        self.previous_count = 0
+        self.filter = make_filter()
+        # Calibration needs a whole revolution of intervals
+        self.edges = EdgeBuffer(max(EDGE_BUFFER_SIZE, magnets + 2))
+        spacing = MagnetSpacing(magnets) if magnets > 1 and MAGNET_CALIBRATION else None
+        self.estimator = None if SPEED_ESTIMATOR == "window" else SpeedEstimator(self.edge_distance_m, spacing=spacing)
+        self.ride_start = 0  # Number of the first edge since the last stop
+        self.processed = 0  # Edges already taken in by the meter
+        self.pending = False  # A handoff to the meter is queued
+        self.stop_interval = EDGE_TIMEOUT  # Last interval before the last stop
+        self.state = WheelState(0, (), False, 0, 0, 0, 0, 0)
+        self.listeners = []
         
         self.sensor.when_pressed = self.detected
         
-        # Start monitoring thread
-        self.monitor_thread = Thread(target=self.round_meter, daemon=True)
-        self.monitor_thread.start()
+        # Periodic measuring runs on the shared scheduler
+        self.monitor_task = scheduler.every(DECAY_RATE if self.estimator else PERIOD, self.round_meter)
         
         atexit.register(self.cleanup)  # Register cleanup function
         
-        if DEBUG_MODE:
-            self.debug_thread = Thread(target=self.debug_output, daemon=True)
-            self.debug_thread.start()
+        if log.enabled("main_wheel"):
+            self.debug_task = scheduler.every(DEBUG_REFRESH_RATE, self.debug_output)
     
     def cleanup(self):
         """Clean up GPIO resources"""
         self.sensor.close()
     
+    def add_listener(self, callback):
+        """Call callback (from the meter) on every edge, speed or movement change"""
+        self.listeners.append(callback)
+    
+    def _notify(self):
+        for callback in self.listeners:
+            callback()
+    
+    def snapshot(self):
+        """Latest WheelState"""
+        return self.state
+    
+    @property
+    def speed(self):
+        return self.state.speed
+    
+    @property
+    def avg_speed(self):
+        return self.state.avg_speed
+    
+    @property
+    def is_moving(self):
+        return self.state.moving
+    
+    @property
+    def start_time(self):
+        return self.state.start_time
+    
+    @property
+    def stop_time(self):
+        return self.state.stop_time
+    
     def detected(self):
-        self.count += 1
-        if not self.is_moving:
-            self.is_moving = True
-            self.start_time = time()
+        # Sensor path: record the edge, the meter takes it in on the next scheduler tick
+        self.edges.push(now())
+        self._hand_off()
+    
+    def _hand_off(self):
+        # One meter task per burst of edges: the flag is only cleared by the meter
+        if not self.pending:
+            self.pending = True
+            scheduler.after(0, self._take_pending, name="main_wheel_edge")
+    
+    def _take_pending(self):
+        # Cleared first, so an edge pushed from now on queues another handoff
+        self.pending = False
+        self.take_edges()
+    
+    def take_edges(self):
+        """Take in the edges pushed since the last call"""
+        count, stamps = self.edges.snapshot(self.ride_start)
+        new = count - self.processed
+        if not new:
+            return
+        self.processed = count
+        state = self.state
+        speed = state.speed
+        
+        # Edge-based estimators update on every revolution
+        if self.estimator:
+            for end in range(max(len(stamps) - new + 1, 1), len(stamps) + 1):
+                speed = self.estimator.on_edge(stamps[:end], count - len(stamps) + end)
+        
+        start_time = state.start_time
+        if not state.moving:
+            # Shortly after a stop, edges can be the last turns of a slowing wheel: only
+            # an interval shorter than the one before the stop (speeding up) restarts
+            if (state.stop_time and stamps[-1] - state.stop_time < EDGE_TIMEOUT
+                    and (len(stamps) < 2 or stamps[-1] - stamps[-2] >= self.stop_interval)):
+                return
+            start_time = stamps[0]
+        self._publish(count, stamps, True, speed, start_time, state.stop_time, stamps[-1])
+        self._notify()
     
     def round_meter(self):
-        while True:
-            sleep(PERIOD)
-            
-            current_time = time()
-            elapsed = current_time - self.previous_time
-            rounds = self.count / elapsed
-            self.speed = self.circum_m * rounds * 3.6
-            
-            # Check if wheel has stopped
-            if self.speed < MIN_SPEED and self.is_moving:
-                self.is_moving = False
-                self.stop_time = current_time
-            
-            # Rolling average
-            if USE_AVG_SPEED:
-                self.previous_values = np.roll(self.previous_values, -1)
-                self.previous_values[-1] = self.speed
-                self.avg_speed = np.average(self.previous_values)
-            
-            self.count = 0
+        self.take_edges()
+        current_time = now()
+        count, stamps = self.edges.snapshot(self.ride_start)
+        # Edges the meter did not take in yet belong to the next round
+        stamps = stamps[:len(stamps) - (count - self.processed)]
+        state = self.state
+        if self.estimator:
+            speed = self.estimator.decay(stamps, current_time)
+        else:
+            self.count = self.processed - self.previous_count
+            speed = self.edge_distance_m * self.count / (current_time - self.previous_time) * 3.6
+            self.previous_count = self.processed
             self.previous_time = current_time
+        changed = speed != state.speed
+        moving, stop_time = state.moving, state.stop_time
+        
+        if moving and (self._overdue(stamps, speed, current_time) if self.estimator else speed < MIN_SPEED):
+            moving = False
+            stop_time = current_time
+            self.stop_interval = stamps[-1] - stamps[-2] if len(stamps) > 1 else EDGE_TIMEOUT
+            # Intervals spanning a stop would read as a crawl on restart
+            self.ride_start = self.processed
+            stamps = []
+            if self.estimator:
+                self.estimator.reset()
+            changed = True
+        elif not moving and stamps and current_time - stamps[-1] >= EDGE_TIMEOUT:
+            self.ride_start = self.processed  # Lone edge that didn't start a ride
+        
+        self._publish(self.processed, stamps, moving, speed if moving else 0, state.start_time, stop_time, current_time)
+        if changed:
+            self._notify()
+    
+    def _overdue(self, stamps, speed, current_time):
+        """Whether the next edge is so late that the wheel must have stopped"""
+        elapsed = current_time - stamps[-1]
+        if elapsed >= EDGE_TIMEOUT:
+            return True
+        if len(stamps) < 2:
+            return False  # A single edge has no interval yet
+        if speed < MIN_SPEED:
+            return True
+        # Without pedalling, a wheel that slows down is coming to a stop
+        factor = STOP_COAST_FACTOR if self.pedal and not self.pedal.is_moving else STOP_OVERDUE_FACTOR
+        return elapsed > factor * (stamps[-1] - stamps[-2])
+    
+    def _publish(self, count, stamps, moving, speed, start_time, stop_time, sample_time):
+        state = self.state
+        avg_speed = state.avg_speed
+        
+        # Filter each new speed sample (an edge or a decay step)
+        if USE_AVG_SPEED and (speed != state.speed or count != state.count):
+            avg_speed = self.filter.update(speed, sample_time)
+        acceleration = getattr(self.filter, "acceleration", 0.0)
+        self.state = WheelState(count, tuple(stamps), moving, speed, avg_speed, acceleration, start_time, stop_time)
 
     def debug_output(self):
-        while True:
-            if DEBUG_MODE and DEBUG_MAIN_WHEEL:
-                current_time = time()
-                print("\n=== Main Wheel Debug ===")
-                print(f"Rotations this period: {self.count}")
-                print(f"Speed: {self.speed:.2f} km/h")
-                print(f"Avg Speed: {self.avg_speed:.2f} km/h")
-                print(f"Moving: {self.is_moving}")
-                if self.is_moving:
-                    print(f"Active time: {current_time - self.start_time:.1f}s")
-            sleep(DEBUG_REFRESH_RATE)
+        # Through the event log: printing here would hold up the meter on the scheduler thread
+        state = self.snapshot()
+        log.debug("main_wheel", "status", edges=self.count if not self.estimator else len(state.timestamps),
+                  speed=state.speed, avg_speed=state.avg_speed, moving=state.moving,
+                  active_time=now() - state.start_time if state.moving else None)
 
 class MilestoneTracker:
-    def __init__(self):
-        self.active_time = 0
-        self.milestone_count = 0
+    def __init__(self, led=None):
+        self.led = led  # RGBLed showing the milestones
+        # Totals carry over quick restarts, like the trip
+        saved = state.get("milestones") or {}
+        if time.time() - saved.get("saved_at", 0) > RESUME_MAX_AGE:
+            saved = {}
+        self.active_time = saved.get("active_time", 0)
+        self.milestone_count = saved.get("milestone_count", 0)
         self.last_milestone_mark = 0
-        self.marks_triggered = 0
-        self.last_check_time = time()
+        self.marks_triggered = saved.get("marks_triggered", 0)
+        self.last_check_time = now()
+        self.last_saved = self.last_check_time
+        if self.led:
+            self.led.show_milestones(self.milestone_count)
+        
+        if log.enabled("milestone"):
+            self.debug_task = scheduler.every(DEBUG_REFRESH_RATE, self.debug_output)
+    
+    def save(self):
+        state.set("milestones", {
+            "active_time": self.active_time,
+            "milestone_count": self.milestone_count,
+            "marks_triggered": self.marks_triggered,
+            "saved_at": time.time(),  # Wall clock, the monotonic clock restarts with the program
+        })
+        self.last_saved = now()
     
     def update(self, main_wheel_moving, pedal_moving):
-        current_time = time()
+        current_time = now()
         
         if main_wheel_moving and pedal_moving:
             self.active_time += current_time - self.last_check_time
@@ -175,43 +422,47 @@ class MilestoneTracker:
             milestones = int(self.active_time / MILESTONE_TIME)
             if milestones > self.milestone_count:
                 self.milestone_count = milestones
-                print(f"\n🏆 MILESTONE MARK {self.marks_triggered + 1} ACHIEVED! 🏆")
-                print(f"Total active time: {self.active_time/60:.1f} minutes")
+                log.info("milestone", "milestone_mark", mark=self.marks_triggered + 1,
+                         active_minutes=self.active_time / 60)
                 self.marks_triggered += 1
                 self.last_milestone_mark = current_time
+                if self.led:
+                    self.led.show_milestones(self.milestone_count)
+                self.save()
+            elif current_time - self.last_saved >= RESUME_SNAPSHOT_INTERVAL:
+                self.save()
         
         self.last_check_time = current_time
     
     def debug_output(self):
-        if DEBUG_MODE:
-            print("\n=== Milestone Tracker Debug ===")
-            print(f"Active time: {self.active_time/60:.1f} minutes")
-            print(f"Milestones: {self.milestone_count}")
-            print(f"Marks triggered: {self.marks_triggered}")
-            if self.marks_triggered > 0:
-                print(f"Time since last mark: {(time() - self.last_milestone_mark)/60:.1f} minutes")
+        log.debug("milestone", "status", active_minutes=self.active_time / 60, milestones=self.milestone_count,
+                  marks=self.marks_triggered,
+                  since_mark_minutes=(now() - self.last_milestone_mark) / 60 if self.marks_triggered else None)
 
 # Initialize hardware
-main_wheel = MainWheel(PIN)
 pedal = PedalWheel(PEDAL_PIN1, PEDAL_PIN2)  # Using both pedal sensors
+main_wheel = MainWheel(PIN, pedal=pedal)
 volume_control = VolumeEncoder()
-milestone_tracker = MilestoneTracker()
+led = RGBLed()
+volume_control.led = led
+milestone_tracker = MilestoneTracker(led)
 
 # For compatibility with existing code
 speed = 0
 avg_speed = 0
+cadence = 0
 
 def update_speed():
-    global speed, avg_speed
-    while True:
-        speed = main_wheel.speed
-        avg_speed = main_wheel.avg_speed
-        milestone_tracker.update(main_wheel.is_moving, pedal.is_moving)
-        sleep(0.1)
+    global speed, avg_speed, cadence
+    state = main_wheel.snapshot()
+    pedal_state = pedal.snapshot()
+    speed = state.speed
+    avg_speed = state.avg_speed
+    cadence = pedal_state.cadence
+    milestone_tracker.update(state.moving, pedal_state.moving)
 
-# Start speed update thread
-speed_thread = Thread(target=update_speed, daemon=True)
-speed_thread.start()
+# Refresh the shared values on the scheduler
+speed_task = scheduler.every(MOVEMENT_CHECK_RATE, update_speed)
 
 if __name__ == "__main__":
     print(f"Using main wheel pin {PIN} and pedal pins {PEDAL_PIN1} and {PEDAL_PIN2}")
@@ -225,24 +476,22 @@ if __name__ == "__main__":
     print(f"Milestone tracking: Every {MILESTONE_TIME/60:.1f} minutes, mark every {MILESTONE_NOTIFICATION} milestones")
     print("Measuring...")
     
+    if is_simulated():
+        import ride_sim
+        ride_sim.start_from_config()
+    
     if DEBUG_MODE:
         try:
+            # The enabled debug components log from their scheduled debug tasks
             while True:
-                # Show only enabled debug components
-                if DEBUG_MAIN_WHEEL:
-                    main_wheel.debug_output()
-                if DEBUG_PEDAL_WHEEL:
-                    pedal.debug_output()
-                if DEBUG_VOLUME:
-                    volume_control.debug_output()
                 sleep(DEBUG_REFRESH_RATE)
         except KeyboardInterrupt:
             print("\nExiting debug mode...")
     else:
         while True:
             print(f"Main Wheel - Speed: {main_wheel.speed:.2f} km/h | Moving: {main_wheel.is_moving}")
-            print(f"Pedal - Speed: {pedal.speed:.2f} km/h | Moving: {pedal.is_moving} | Direction: {pedal.direction}")
+            print(f"Pedal - Cadence: {pedal.cadence:.1f} rpm | Speed: {pedal.speed:.2f} km/h | Moving: {pedal.is_moving} | Direction: {pedal.direction}")
             if pedal.is_moving and main_wheel.is_moving:
-                print(f"Both wheels active for: {time() - max(pedal.start_time, main_wheel.start_time):.1f} seconds")
+                print(f"Both wheels active for: {now() - max(pedal.start_time, main_wheel.start_time):.1f} seconds")
                 print(f"Milestones: {milestone_tracker.milestone_count} (Marks: {milestone_tracker.marks_triggered})")
             sleep(1)